@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+# Merges all the unit test xml files into one TESTS-TestSuites.xml file, as ant's junitreport does, and writes a summary
+#  of just the failed tests alongside it.
+#
+# Each file is streamed through rather than loaded, so memory stays at about the size of the largest single test case
+#  or system-out however many, or how big, the files are. The files can be parsed on a pool of processes, each into a
+#  fragment of the merged file, which are then joined in order.
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+from typing import Dict, Iterator, List, Match, Optional, TextIO, Tuple
+
+# What ant's junitreport in cassandra-test-report.xml picked up
+INCLUDES = ['**/TEST*.xml', '**/cqlshlib.xml', '**/nosetests.xml']
+
+# The failure summary, TESTS-Failures.json, is {"suites": [{"name", "cases": [{"className", "name", "status",
+#  "errorDetails"}]}]}, the same shape as a Jenkins test report filtered by
+#  'suites[name,cases[className,name,status,errorDetails]]', so it can be read just like one
+FAILED = 'FAILED'
+
+# What needs escaping in an attribute value in double quotes, including the whitespace a parser would otherwise normalise
+ATTRIBUTE_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'}
+attribute_escape_re = re.compile('[&<>"\n\r\t]')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Merges the test result xml files under a directory into one, and '
+                                                 'summarises the failed tests')
+    parser.add_argument('--dir', type=str, default='.', help='Directory to find the test result files under')
+    parser.add_argument('--output', type=str, default='TESTS-TestSuites.xml', help='Merged test results file')
+    parser.add_argument('--failures', type=str, default='TESTS-Failures.json', help='Failed tests summary file')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Processes to parse the files on; 1 for none')
+    args = parser.parse_args()
+
+    paths = find_results(args.dir, args.output)
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    # The fragments go next to the output rather than in /tmp, which may be too small for them
+    with tempfile.TemporaryDirectory(dir=output_dir) as fragment_dir:
+        work = [(path, os.path.join(fragment_dir, str(i) + '.xml')) for i, path in enumerate(paths)]
+        if args.jobs > 1 and len(work) > 1:
+            with multiprocessing.Pool(args.jobs) as pool:
+                suites = list(pool.imap(convert, work))
+        else:
+            suites = [convert(item) for item in work]
+
+        tmp = args.output + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+            merged = 0
+            for (_, fragment), suite in zip(work, suites):
+                if suite is None:
+                    continue
+                # Numbered here, as junitreport does, so the files skipped don't leave gaps
+                out.write(start_tag(merged, suite.pop('attributes')))
+                merged += 1
+                with open(fragment, encoding='utf-8') as f:
+                    shutil.copyfileobj(f, out)
+                out.write('</testsuite>\n')
+            out.write('</testsuites>\n')
+        os.replace(tmp, args.output)
+
+    failed_suites = [suite for suite in suites if suite is not None and suite['cases']]
+    with open(args.failures, 'w', encoding='utf-8') as out:
+        json.dump({'suites': failed_suites}, out, indent=1)
+        out.write('\n')
+    print('Merged ' + str(merged) + ' of ' + str(len(paths)) + ' test result files into ' + args.output + ', with '
+          + str(sum(len(suite['cases']) for suite in failed_suites)) + ' failures in ' + args.failures)
+
+
+def find_results(directory: str, output: str) -> List[str]:
+    """
+    :return: the test result files under directory, but not the merged one from a previous run
+    """
+    paths = set()
+    for include in INCLUDES:
+        paths.update(glob.glob(os.path.join(directory, include), recursive=True))
+    output = os.path.abspath(output)
+    return sorted(path for path in paths if os.path.isfile(path) and os.path.abspath(path) != output)
+
+
+def convert(item: Tuple[str, str]) -> Optional[Dict]:
+    """
+    Streams what's inside the testsuite in one test result file into its fragment of the merged file. Runs on the pool.
+    :return: the suite's attributes, name and failed cases, or None if the file isn't a testsuite that could be read,
+    which junitreport also skips
+    """
+    path, fragment = item
+    try:
+        with open(fragment, 'w', encoding='utf-8') as out:
+            return stream_suite(path, out)
+    except (ET.ParseError, OSError) as e:
+        print('WARN skipping ' + path + ': ' + str(e), file=sys.stderr)
+        return None
+
+
+def stream_suite(path: str, out: TextIO) -> Optional[Dict]:
+    """
+    :return: the suite's attributes, name and failed cases, or None if the file isn't a testsuite
+    """
+    depth = 0
+    root = None
+    suite = None
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                if element.tag != 'testsuite':
+                    print('WARN skipping ' + path + ': not a testsuite', file=sys.stderr)
+                    return None
+                root = element
+                suite = {'name': element.get('name', ''), 'cases': [], 'attributes': dict(element.attrib)}
+            continue
+
+        depth -= 1
+        if depth == 1:
+            if element.tag == 'testcase':
+                suite['cases'].extend(failed(element, suite['name']))
+            # Each child of the testsuite is written out and dropped, so the tree of the whole file is never built
+            out.write(serialize(element))
+            root.clear()
+    return suite
+
+
+def serialize(element: ET.Element) -> str:
+    """
+    :return: the element as xml; most are test cases that passed, with nothing inside them, which ElementTree is slow to
+    write for the little there is to them
+    """
+    if len(element) == 0 and not element.text and not any('{' in name for name in (element.tag, *element.attrib)):
+        return '<' + element.tag + attributes_xml(element.attrib) + ' />\n'
+    element.tail = None
+    return ET.tostring(element, encoding='unicode') + '\n'
+
+
+def attributes_xml(attributes: Dict[str, str]) -> str:
+    return ''.join(' ' + key + '="' + attribute_escape_re.sub(escape, value) + '"' for key, value in attributes.items())
+
+
+def escape(match: Match) -> str:
+    return ATTRIBUTE_ESCAPES[match.group()]
+
+
+def start_tag(i: int, attributes: Dict[str, str]) -> str:
+    """
+    :return: the testsuite's start tag renamed as junitreport does: the package split out of the name, and an id for
+    where it is in the merged file
+    """
+    full_name = attributes.get('name', '')
+    package, _, name = full_name.rpartition('.')
+    attributes = dict(attributes, name=name, package=package, id=str(i))
+    return '<testsuite' + attributes_xml(attributes) + '>\n'
+
+
+def failed(testcase: ET.Element, suite_name: str) -> Iterator[Dict]:
+    """
+    :return: the case, as a Jenkins test report has it, if it failed or errored
+    """
+    for problem in testcase:
+        if problem.tag in ('failure', 'error'):
+            yield {'className': testcase.get('classname') or suite_name, 'name': testcase.get('name', ''),
+                   'status': FAILED, 'errorDetails': problem.get('message')}
+            return
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,11 @@
 #!/bin/bash
 
-# merge all the unit test xml files into one TESTS-TestSuites.xml file (which will get archived at nightlies.a.o)
-#  set java heap max to known jenkins executor available memory
-ANT_OPTS="-Xmx15G ${ANT_OPTS}" ant -quiet -silent -f ./cassandra-builds/build-scripts/cassandra-test-report.xml || ( echo "WARN failed to unify test results" && touch TESTS-TestSuites.xml )
+# merge all the unit test xml files into one TESTS-TestSuites.xml file (which will get archived at nightlies.a.o),
+#  and summarise the failed tests in TESTS-Failures.json
+#  this streams through the files in little memory, only agents without python3 fall back to ant's junitreport
+if command -v python3 >/dev/null 2>&1 ; then
+    python3 ./cassandra-builds/build-scripts/cassandra-test-report.py || ( echo "WARN failed to unify test results" && touch TESTS-TestSuites.xml )
+else
+    #  set java heap max to known jenkins executor available memory
+    ANT_OPTS="-Xmx15G ${ANT_OPTS}" ant -quiet -silent -f ./cassandra-builds/build-scripts/cassandra-test-report.xml || ( echo "WARN failed to unify test results" && touch TESTS-TestSuites.xml )
+fi
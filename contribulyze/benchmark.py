@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#
+
+#
+# Benchmarks contribulyze.py against the way it used to work, over the
+# history of a cloned repository, and checks that the results are the
+# same.  Run with --help for details.
+#
+
+import getopt
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import contribulyze
+
+
+# The regexps the "patch by" and "reviewed by" fields used to be parsed
+# with, which were matched against the whole message, as the old
+# graze() accumulated it from the default `git log` format: indented
+# by four spaces, and without blank lines.
+old_patch_by_re = re.compile('(?:.*\n)*.*patch by ([^;]+)(;|,)', flags=re.IGNORECASE | re.MULTILINE)
+old_reviewed_by_re = re.compile('(?:.*\n)*.*[;, ](?:review|test)(?:ed)? by ((?:.|\n)+?)(?=(?: |\n)+for(?: |\n)+(?:cassandra-|#[0-9]+))', flags=re.IGNORECASE | re.MULTILINE)
+
+def old_message(message):
+  """Return MESSAGE as the old graze() accumulated it."""
+  return ''.join('    %s\n' % line for line in message.split('\n') if line)
+
+def old_names(message):
+  """Return the patchers and reviewers the old regexps found in
+  MESSAGE, which is in the form given by old_message()."""
+  found = [ ]
+  for regexp in old_patch_by_re, old_reviewed_by_re:
+    m = regexp.match(message)
+    found.append(contribulyze.split_names(m.group(1)) if m else [ ])
+  return found
+
+def new_names(message):
+  """Return the patchers and reviewers the trailer parser finds in
+  MESSAGE, as parse_fields() does."""
+  found = [ ]
+  message = contribulyze.log_layout(message)
+  for find in contribulyze.find_patch_by, contribulyze.find_reviewed_by:
+    names = find(message)
+    found.append(contribulyze.split_names(names) if names is not None else [ ])
+  return found
+
+def pathological_messages(lines):
+  """Return messages of about LINES lines each on which the old regexps
+  backtrack badly."""
+  return (('Merge branch cassandra-4.1 into trunk', 'CHANGES.txt excerpt:\n' + ' * Fix a thing (CASSANDRA-1)\n' * lines + 'patch by A; reviewed by B for CASSANDRA-2'),
+          ('Repeated unterminated fields', 'patch by a, reviewed by b ' * lines),
+          ('Reviews without a ticket', (' reviewed by x' + ' ' * 50 + '\n') * lines))
+
+# Messages where fields end at the start of a line, after blank lines
+# or at the end of the message, where the layout of the messages the
+# regexps were matched against makes a difference.
+edge_messages = ('tested by tested by  tested by \nfor CASSANDRA-1 x',
+                 'reviewed by A\nfor CASSANDRA-1',
+                 'Fix\n\npatch by A; reviewed by B and\nby C\n\nfor CASSANDRA-2\n',
+                 'patch by A,\nB\n\nreviewed by\n\nfor #12',
+                 'Reviewed by A for CASSANDRA-3',
+                 'x\nreviewed by A for CASSANDRA-3\n')
+
+# What the messages fuzz_messages() makes are made of.
+fuzz_tokens = ('patch by ', 'Patch By ', 'dispatch by ', ';', ',', ' ', '\n', '\n\n', 'reviewed by ',
+               ' reviewed by ', ',review by ', ';tested by ', ' test by ', 'tested by ', 'for ', ' for ',
+               'for\n', '\nfor ', 'CASSANDRA-', 'cassandra-', '#', '12', 'Bob', 'and ', ' and\n', '\nand\n',
+               'by ', '\nby ', 'x', '\u0130', 'reviewed', '  ', '\n for \n CASSANDRA-1')
+
+def fuzz_messages(count, seed=0):
+  """Return COUNT random messages made of fuzz_tokens."""
+  rng = random.Random(seed)
+  return [''.join(rng.choice(fuzz_tokens) for i in range(rng.randint(0, 25)))
+          for message in range(count)]
+
+def timed(function, messages):
+  """Return the results of FUNCTION on each of MESSAGES, and the
+  seconds that took."""
+  start = time.perf_counter()
+  results = [function(message) for message in messages]
+  return results, time.perf_counter() - start
+
+def check_parse(messages):
+  """Return the number of MESSAGES in which the trailer parser and the
+  old regexps find different names."""
+  differences = 0
+  for message in messages:
+    old, new = old_names(old_message(message)), new_names(message)
+    if old != new:
+      differences += 1
+      if differences <= 10:
+        sys.stderr.write('%r: the regexps found %s, the parser %s\n' % (message, old, new))
+  return differences
+
+def bench_parse(repo_dir, logs, pathological_lines, fuzz):
+  """Compare the trailer parser with the old regexps over LOGS, the
+  history of REPO_DIR, over messages of about PATHOLOGICAL_LINES lines
+  on which the regexps backtrack, and over edge_messages and FUZZ
+  random messages.  Return the number of differences."""
+  messages = [log.message for log in logs]
+  old_messages = [old_message(message) for message in messages]
+  old, old_seconds = timed(old_names, old_messages)
+  new, new_seconds = timed(new_names, messages)
+  differences = 0
+  for log, old_found, new_found in zip(logs, old, new):
+    if old_found != new_found:
+      differences += 1
+      sys.stderr.write('%s: the regexps found %s, the parser %s\n' % (log.sha, old_found, new_found))
+  print('Trailer parsing, %d commits in %s:' % (len(logs), repo_dir))
+  print('  regexps  %8.3fs  %8.0f commits/s' % (old_seconds, len(logs) / old_seconds))
+  print('  parser   %8.3fs  %8.0f commits/s' % (new_seconds, len(logs) / new_seconds))
+  print('  %d commits attributed differently' % differences)
+  for title, message in pathological_messages(pathological_lines):
+    old, old_seconds = timed(old_names, [old_message(message)])
+    new, new_seconds = timed(new_names, [message])
+    if old != new:
+      differences += 1
+      sys.stderr.write('%s: the regexps found %s, the parser %s\n' % (title, old[0], new[0]))
+    print('%s, %d bytes: regexps %.3fs, parser %.4fs%s'
+          % (title, len(message), old_seconds, new_seconds, '' if old == new else ', DIFFERENT'))
+  edge_differences = check_parse(edge_messages)
+  print('%d of %d edge case messages attributed differently' % (edge_differences, len(edge_messages)))
+  fuzz_differences = check_parse(fuzz_messages(fuzz))
+  print('%d of %d random messages attributed differently' % (fuzz_differences, fuzz))
+  return differences + edge_differences + fuzz_differences
+
+# Contributor.add_activity() and score() as they were, when each
+# activity was a list searched on every insert.
+def list_add_activity(self, field, log):
+  logs = self.activities.get(field.name)
+  if not logs:
+    logs = [ ]
+    self.activities[field.name] = logs
+  if not log in logs:
+    logs.append(log)
+
+def list_score(self):
+  score = 0
+  for activity in self.activities.keys():
+    score += len(self.activities[activity])
+  return score
+
+def credit_store(store, repos, sorts):
+  """Load the commits of REPOS from STORE and credit their
+  contributors, as a run with an up to date store does, then sort the
+  contributors SORTS times.  Return the top 20 contributors and their
+  scores, and the seconds the loading and the sorting took."""
+  contribulyze.reset()
+  start = time.perf_counter()
+  for repo in repos:
+    for log in contribulyze.load_logs(store, repo, False):
+      contribulyze.credit(log)
+  loaded = time.perf_counter()
+  contributors = set(contribulyze.Contributor.all_contributors.values())
+  for i in range(sorts):
+    ranked = sorted(contributors, key=contribulyze.Contributor.sort_key, reverse=True)
+  done = time.perf_counter()
+  top = [(c.big_name(), c.score()) for c in ranked[:20]]
+  return top, loaded - start, done - loaded
+
+def bench_activities(repo_dir, logs, copies, sorts):
+  """Compare crediting the contributors of COPIES copies of LOGS, the
+  history of REPO_DIR, loaded from a store, with the activities kept
+  in lists and in dicts.  Return the number of differences in the top
+  20."""
+  repo = os.path.basename(repo_dir)
+  # Each copy is stored as another repository, so that its commits are
+  # distinct LogMessages, as in a history COPIES times as long.
+  repos = ['%s-%d' % (repo, i) for i in range(copies)]
+  with tempfile.TemporaryDirectory() as store_dir:
+    store = contribulyze.open_store(os.path.join(store_dir, 'store.db'))
+    for copy in repos:
+      contribulyze.save_logs(store, copy, 'HEAD', logs)
+    top, load_seconds, sort_seconds = credit_store(store, repos, sorts)
+    add_activity, score = contribulyze.Contributor.add_activity, contribulyze.Contributor.score
+    contribulyze.Contributor.add_activity, contribulyze.Contributor.score = list_add_activity, list_score
+    try:
+      list_top, list_load_seconds, list_sort_seconds = credit_store(store, repos, sorts)
+    finally:
+      contribulyze.Contributor.add_activity, contribulyze.Contributor.score = add_activity, score
+    store.close()
+  differences = 0
+  for ranked, list_ranked in zip(top, list_top):
+    if ranked != list_ranked:
+      differences += 1
+      sys.stderr.write('The lists ranked %s where the dicts ranked %s\n' % (list_ranked, ranked))
+  print('Loading the store and crediting %d commits, then sorting the contributors %d times:'
+        % (len(logs) * copies, sorts))
+  print('  lists  %8.3fs load  %8.3fs sort' % (list_load_seconds, list_sort_seconds))
+  print('  dicts  %8.3fs load  %8.3fs sort' % (load_seconds, sort_seconds))
+  print('  top 20: %s' % ', '.join('%s %d' % (name, score) for name, score in top))
+  print('  %d of the top 20 ranked differently' % differences)
+  return differences
+
+def usage():
+  print('''Usage: %s [OPTIONS] REPO_DIR
+
+Benchmark contribulyze.py on the history of REPO_DIR, a clone of, e.g.,
+https://github.com/apache/cassandra.git, against the way it used to work,
+and check that the results are the same.  Exits with status 1 if not.
+What is benchmarked:
+
+  - Parsing the "patch by" and "reviewed by" fields of every commit,
+    and of messages on which the regexps that used to parse them
+    backtrack badly, with the trailer parser and with those regexps,
+    and checking that they find the same names in those, in some edge
+    cases, and in random messages.
+  - Loading the commits from a store and crediting their contributors,
+    with each contributor's activities kept in dicts and in the lists
+    they used to be kept in, and sorting the contributors.
+
+Options:
+
+  -h, --help                   Show this usage message
+  -l, --pathological-lines N   Lines in the messages on which the old
+                               regexps backtrack (default: 1000)
+  -f, --fuzz N                 Random messages to parse (default: 100000)
+  -c, --copies N               Copies of the history to credit, to try a
+                               longer one (default: 1)
+  --sorts N                    Times to sort the contributors (default: 200)
+''' % os.path.basename(sys.argv[0]))
+
+def main():
+  try:
+    opts, args = contribulyze.my_getopt(sys.argv[1:], 'hl:f:c:',
+                                         ['help', 'pathological-lines=', 'fuzz=', 'copies=', 'sorts='])
+  except getopt.GetoptError as e:
+    contribulyze.complain(str(e) + '\n\n')
+    usage()
+    sys.exit(1)
+  pathological_lines = 1000
+  fuzz = 100000
+  copies = 1
+  sorts = 200
+  for opt, value in opts:
+    if opt in ('-h', '--help'):
+      usage()
+      sys.exit(0)
+    elif opt in ('-l', '--pathological-lines'):
+      pathological_lines = int(value)
+    elif opt in ('-f', '--fuzz'):
+      fuzz = int(value)
+    elif opt in ('-c', '--copies'):
+      copies = int(value)
+    elif opt == '--sorts':
+      sorts = int(value)
+  if len(args) != 1:
+    usage()
+    sys.exit(1)
+  repo_dir = args[0]
+  logs = contribulyze.read_log(repo_dir, os.path.basename(repo_dir), 'HEAD')
+  differences = bench_parse(repo_dir, logs, pathological_lines, fuzz)
+  differences += bench_activities(repo_dir, logs, copies, sorts)
+  if differences:
+    sys.exit(1)
+
+if __name__ == '__main__':
+  main()
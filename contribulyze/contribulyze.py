@@ -27,13 +27,21 @@
 #  Copied and evolved from script of same name from Apache Subversion
 #
 
+import bisect
+import concurrent.futures
 import getopt
+import hashlib
 import json
 import os
 import re
 import requests
+import resource
+import sqlite3
+import subprocess
 import sys
-from dateutil import parser
+import time
+import unicodedata
+from datetime import datetime, timedelta, timezone
 from urllib.parse import quote as urllib_parse_quote
 try:
   my_getopt = getopt.gnu_getopt
@@ -75,6 +83,11 @@ class Contributor(object):
   # name and that same email address together, we create only one
   # instance, and store it under both the email and the real name.
   all_contributors = { }
+  # Map names to the names they resolve to, see Identities.
+  resolved_names = { }
+
+  __slots__ = ('name', 'aliases', 'email', 'is_committer', 'activities',
+               'patch_count', 'other_count', 'interactions')
 
   def __init__(self, name, email):
     """Instantiate a contributor.  Don't use this to generate a
@@ -83,11 +96,16 @@ class Contributor(object):
     self.aliases  = set()
     self.email     = email
     self.is_committer = False       # Assume not until hear otherwise.
-    # Map verbs (e.g., "Patch", "Suggested", "Review") to lists of
-    # LogMessage objects.  For example, the log messages stored under
-    # "Patch" represent all the revisions for which this contributor
-    # contributed a patch.
+    # Map verbs (e.g., "Patch", "Suggested", "Review") to dicts whose
+    # keys are LogMessage objects, in the order they were added (the
+    # dicts are used as ordered sets).  For example, the log messages
+    # stored under "Patch" represent all the revisions for which this
+    # contributor contributed a patch.
     self.activities = { }
+    # Counts of the log messages in activities, kept by add_activity()
+    # so that scoring and sorting contributors need not count them.
+    self.patch_count = 0
+    self.other_count = 0
     self.interactions = set()
 
   def add_aliases(self, alias):
@@ -98,11 +116,15 @@ class Contributor(object):
   def add_activity(self, field, log):
     """Record that this contributor was active in FIELD_NAME in LOG."""
     logs = self.activities.get(field.name)
-    if not logs:
-      logs = [ ]
+    if logs is None:
+      logs = { }
       self.activities[field.name] = logs
     if not log in logs:
-      logs.append(log)
+      logs[log] = True
+      if field.name == 'Patch':
+        self.patch_count += 1
+      else:
+        self.other_count += 1
 
   def add_collaboration(self, field):
     for c in field.contributors:
@@ -114,6 +136,8 @@ class Contributor(object):
     """If this contributor is already registered, just return it;
     otherwise, register it then return it.  Hint: use parse() to
     generate the arguments."""
+    if name:
+      name = Contributor.resolved_names.get(name, name)
     c = None
     for key in name, email:
       if key and key in Contributor.all_contributors:
@@ -139,20 +163,12 @@ class Contributor(object):
   def score(self):
     """Return a contribution score for this contributor."""
     # Right now we count both patches and reviews as 1
-    score = 0
-    for activity in self.activities.keys():
-      score += len(self.activities[activity])
-    return score
+    return self.patch_count + self.other_count
 
   def score_str(self):
     """Return a contribution score HTML string for this contributor."""
-    patch_score = 0
-    other_score = 0
-    for activity in self.activities.keys():
-      if activity == 'Patch':
-        patch_score += len(self.activities[activity])
-      else:
-        other_score += len(self.activities[activity])
+    patch_score = self.patch_count
+    other_score = self.other_count
     if patch_score == 0:
       patch_str = ""
     elif patch_score == 1:
@@ -280,17 +296,17 @@ class Contributor(object):
       s += ']'
     return s
 
-  def html_out(self, filename, title):
-    """Create an HTML file named FILENAME, showing all the revisions in which
-    this contributor was active."""
-    out = open(filename, 'w')
-    out.write(html_header('%s %s' % (self.big_name(html_eo=True), title), '%s %s' % (self.big_name(html=True), title), True))
+  def html_page(self, title):
+    """Return an HTML page showing all the revisions in which this
+    contributor was active."""
+    out = [ ]
+    out.append(html_header('%s %s' % (self.big_name(html_eo=True), title), '%s %s' % (self.big_name(html=True), title), True))
 
     sorted_interactions = sorted(self.interactions, key=Contributor.sort_key, reverse=True)
-    out.write('<div class="h2" id="interactions" title="interactions">\n\n')
-    out.write('<table border="1"><tr><td>&nbsp;%s Collaborator</td></tr>\n' % (len(sorted_interactions)))
-    out.write('<tr>\n')
-    out.write('<td>\n')
+    out.append('<div class="h2" id="interactions" title="interactions">\n\n')
+    out.append('<table border="1"><tr><td>&nbsp;%s Collaborator</td></tr>\n' % (len(sorted_interactions)))
+    out.append('<tr>\n')
+    out.append('<td>\n')
     first_activity = True
     for interaction in sorted_interactions:
         s = ' , '
@@ -298,55 +314,56 @@ class Contributor(object):
           s = ''
           first_activity = False
         urlpath = "%s.html" % (interaction.canonical_name())
-        out.write('%s<a href="%s">%s</a>' % (s, urllib_parse_quote(urlpath), interaction.name))
+        out.append('%s<a href="%s">%s</a>' % (s, urllib_parse_quote(urlpath), interaction.name))
 
-    out.write('</td>\n')
-    out.write('</tr>\n')
-    out.write('</table><br/>\n\n')
+    out.append('</td>\n')
+    out.append('</tr>\n')
+    out.append('</table><br/>\n\n')
 
     unique_logs = { }
 
     sorted_activities = sorted(self.activities.keys())
 
-    out.write('<div class="h2" id="activities" title="activities">\n\n')
-    out.write('<table border="1">\n')
-    out.write('<tr>\n')
+    out.append('<div class="h2" id="activities" title="activities">\n\n')
+    out.append('<table border="1">\n')
+    out.append('<tr>\n')
     for activity in sorted_activities:
-      out.write('<td>&nbsp;%s %s</td>\n\n' % (len(self.activities[activity]), activity))
-    out.write('</tr>\n')
-    out.write('<tr>\n')
+      out.append('<td>&nbsp;%s %s</td>\n\n' % (len(self.activities[activity]), activity))
+    out.append('</tr>\n')
+    out.append('<tr>\n')
     for activity in sorted_activities:
-      out.write('<td>\n')
+      out.append('<td>\n')
       first_activity = True
       for log in self.activities[activity]:
         s = ',\n'
         if first_activity:
           s = ''
           first_activity = False
-        out.write('%s<a href="#%s">%s</a>' % (s, log.sha, log.sha))
+        out.append('%s<a href="#%s">%s</a>' % (s, log.sha, log.sha))
         unique_logs[log] = True
-      out.write('</td>\n')
-    out.write('</tr>\n')
-    out.write('</table>\n\n')
-    out.write('</div>\n\n')
+      out.append('</td>\n')
+    out.append('</tr>\n')
+    out.append('</table>\n\n')
+    out.append('</div>\n\n')
 
     sorted_logs = sorted(unique_logs.keys(), key=LogMessage.sort_key, reverse=True)
     for log in sorted_logs:
-      out.write('<hr />\n')
-      out.write('<div class="h3" id="%s" title="%s">\n' % (log.sha, log.sha))
-      out.write('<pre>\n')
+      out.append('<hr />\n')
+      out.append('<div class="h3" id="%s" title="%s">\n' % (log.sha, log.sha))
+      out.append('<pre>\n')
       sha = '<a href="https://github.com/search?q=org:apache+%s+repo:apache/cassandra*&type=commits&ref=advsearch">%s</a>' % (log.sha, log.sha)
-      out.write('<b>%s | %s | %s</b>\n\n' % (sha, escape_html(log.author), log.date))
-      out.write(spam_guard_in_html_block(re.sub(r'for CASSANDRA-([0-9]+)', r'for <a href="https://issues.apache.org/jira/browse/CASSANDRA-\1">CASSANDRA-\1</a>', escape_html(log.message))))
-      out.write('</pre>\n')
-      out.write('</div>\n\n')
-    out.write('<hr />\n')
+      out.append('<b>%s | %s | %s</b>\n\n' % (sha, escape_html(log.author), log.when()))
+      out.append(spam_guard_in_html_block(re.sub(r'for CASSANDRA-([0-9]+)', r'for <a href="https://issues.apache.org/jira/browse/CASSANDRA-\1">CASSANDRA-\1</a>', escape_html(load_message(log)))))
+      out.append('</pre>\n')
+      out.append('</div>\n\n')
+    out.append('<hr />\n')
 
-    out.write(html_footer())
-    out.close()
+    out.append(html_footer())
+    return ''.join(out)
 
 class Field:
   """One field in one log message."""
+  __slots__ = ('name', 'alias', 'contributors', 'addendum')
   def __init__(self, name, alias = None):
     # The name of this field (e.g., "Patch", "Review", etc).
     self.name = name
@@ -378,22 +395,41 @@ class LogMessage(object):
   # Maps sha strings onto LogMessage instances,
   # holding all the LogMessage instances ever created.
   all_logs = { }
-  author = None
-  date = None
-  message = ''
+  # The latest LogMessage credited, see credit().
   latest = None
-  def __init__(self, sha):
+
+  # There are a lot of these, one per commit in every repository, so
+  # they are kept small: slotted, with interned strings and tuples, and
+  # dates in seconds since the epoch.
+  __slots__ = ('sha', 'repo', 'author', 'date', 'offset', 'committed',
+               'message', 'paths', 'patchers', 'reviewers', 'emails', 'fields')
+
+  def __init__(self, sha, repo = None):
     """Instantiate a log message.  All arguments are strings, including commit."""
     self.sha = sha
+    # The name of the repository the commit was read from, if known.
+    self.repo = repo
+    self.author = None
+    # The author date, its UTC offset in minutes, and the commit date.
+    self.date = None
+    self.offset = 0
+    self.committed = None
+    # The raw message, or None if it is to be read by load_message().
+    self.message = ''
+    # The paths the commit touched, if the log was read with --name-only.
+    self.paths = ()
+    # Names of the contributors found by parse_fields(), in the order
+    # they were found.
+    self.patchers = ()
+    self.reviewers = ()
+    # (name, email) pairs of the author and any co-authors.
+    self.emails = ()
     # Map field names (e.g., "Patch", "Review") onto Field objects.
     self.fields = { }
     if not sha in LogMessage.all_logs:
       LogMessage.all_logs[sha] = self
   def add_field(self, field):
     self.fields[field.name] = field
-  def accum(self, line):
-    """Accumulate one more line of raw message."""
-    self.message += line
 
   def __cmp__(self, other):
     """Compare two log messages by date, for sort().
@@ -409,6 +445,11 @@ class LogMessage(object):
   def sort_key(self):
     return self.date
 
+  def when(self):
+    """Return the date of this log message as a datetime, in the time
+    zone of its author."""
+    return datetime.fromtimestamp(self.date, timezone(timedelta(minutes=self.offset)))
+
   def __str__(self):
     s = '=' * 15
     header = ' COMMIT: %s | %s \n %s' % (self.sha, self.author, self.message)
@@ -424,21 +465,86 @@ class LogMessage(object):
     return s
 
 def process_aliases(aliases_input):
-  line = aliases_input.readline()
-  while line:
+  for line in aliases_input:
     aliases = line.split(',')
     c = Contributor.get(aliases.pop(0).strip(), None)
     for alias in aliases:
       c.add_aliases(alias.strip())
-    line = aliases_input.readline()
-
-def process_committers():
-    committers_url = 'https://whimsy.apache.org/public/public_ldap_projects.json'
-    names_url = 'https://whimsy.apache.org/public/icla-info.json'
-    committers = json.loads(requests.get(committers_url).text)['projects']['cassandra']['members']
-    names_json = json.loads(requests.get(names_url).text)['committers']
-    for committer in committers:
-        name = names_json.get(committer, committer)
+
+# The project's committers come from whimsy.  Fetching the roster is
+# slow (icla-info.json is large), so it can be kept in a roster file:
+# a JSON object holding the time it was fetched, the ETag and
+# Last-Modified headers whimsy sent for each URL, and the list of
+# [committer_id, real_name] pairs, which is all that is kept of it.
+committers_url = 'https://whimsy.apache.org/public/public_ldap_projects.json'
+names_url = 'https://whimsy.apache.org/public/icla-info.json'
+
+def fetch_json(url, validators=None):
+    """Fetch the JSON document at URL.  If VALIDATORS, a dict of the
+    ETag and Last-Modified headers of an earlier response, show it is
+    unchanged, return None for it.  Return the document and the new
+    validators."""
+    headers = { }
+    if validators:
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+    response = requests.get(url, headers=headers, timeout=60)
+    if response.status_code == 304:
+        return None, validators
+    response.raise_for_status()
+    return response.json(), dict((header, response.headers[header])
+                                 for header in ('ETag', 'Last-Modified')
+                                 if header in response.headers)
+
+def fetch_roster(roster=None):
+    """Fetch the committer roster from whimsy, only downloading what
+    changed since ROSTER, an earlier roster, if given."""
+    validators = roster['validators'] if roster else { }
+    known = dict(roster['committers']) if roster else { }
+    projects, committers_validators = fetch_json(committers_url, validators.get(committers_url))
+    if projects is None:
+        committers = list(known)
+    else:
+        committers = projects['projects']['cassandra']['members']
+    # Only the names of known committers are kept, so new committers
+    # need all the names again.
+    names_validators = validators.get(names_url) if set(committers) <= set(known) else None
+    names, names_validators = fetch_json(names_url, names_validators)
+    names = known if names is None else names['committers']
+    return { 'fetched': time.time(),
+             'validators': { committers_url: committers_validators,
+                             names_url: names_validators },
+             'committers': [[committer, names.get(committer, committer)]
+                            for committer in committers] }
+
+def fetch_committers(roster_file=None, ttl=None):
+    """Return a list of (committer_id, real_name) pairs for the project's
+    committers.  If ROSTER_FILE is given, the roster is read from it, and
+    only fetched again, and saved to it, once older than TTL seconds.  A
+    TTL of None means never fetch it again."""
+    roster = None
+    if roster_file and os.path.exists(roster_file):
+        with open(roster_file) as roster_input:
+            roster = json.load(roster_input)
+        if ttl is None or time.time() - roster['fetched'] < ttl:
+            return roster['committers']
+    try:
+        roster = fetch_roster(roster)
+    except (requests.RequestException, ValueError) as e:
+        if roster is None:
+            raise
+        complain('Could not fetch the committer roster, using %s: %s\n' % (roster_file, e))
+        return roster['committers']
+    if roster_file:
+        with open(roster_file + '.tmp', 'w') as roster_output:
+            json.dump(roster, roster_output)
+        os.replace(roster_file + '.tmp', roster_file)
+    return roster['committers']
+
+def process_committers(committers):
+    for committer, name in committers:
         if committer in Contributor.all_contributors and not name in Contributor.all_contributors:
             c = Contributor.get(committer, None)
             c.add_aliases(name)
@@ -447,76 +553,358 @@ def process_committers():
             c.add_aliases(committer)
         c.is_committer = True
 
+def reset():
+  """Forget all contributors, ready for another report."""
+  Contributor.all_contributors = { }
+  LogMessage.latest = None
+
+#
+# Identity stuff.
+#
+# The same person appears in the logs under many names, e.g.,
+# "Benjamin Lerer", "benjamin lerer", "Benjamin  Lerer" and "blerer".
+# Besides the names listed together in contribulyze.aliases, names
+# are resolved to one name per person by joining, with a union-find,
+# the names that
+#
+#   - are the same but for case, whitespace and diacritics,
+#   - are a committer's id and real name, according to whimsy,
+#   - were used with the same email address, in Author: and
+#     Co-authored-by: lines, unless so many names used it that it is
+#     shared (e.g., noreply@github.com), or
+#   - are a committer's id and the user of an apache.org address.
+#
+# Names that merely look alike, such as "Lerer Benjamin" or "blerer",
+# for "Benjamin Lerer", are not joined, but are suggested as aliases
+# to review by suggestions().
+#
+
+def fold(name):
+  """Return NAME without case, diacritics or repeated whitespace."""
+  name = unicodedata.normalize('NFKD', name)
+  name = ''.join(char for char in name if not unicodedata.combining(char))
+  return ' '.join(name.casefold().split())
+
+look_alike_punctuation_re = re.compile("[-.,'_]")
+
+def look_alike_keys(name):
+  """Return keys under which names that look like NAME are found: its
+  words in any order, and its first initial and last word together
+  (which is how many committer ids are made up)."""
+  words = look_alike_punctuation_re.sub(' ', fold(name)).split()
+  if len(words) == 1:
+    return [('initial', words[0])]
+  if len(words) > 1:
+    return [('words', ' '.join(sorted(words))),
+            ('initial', words[0][0] + words[-1])]
+  return [ ]
+
+class Identities(object):
+  """A union-find of contributors' names and email addresses, by which
+  names are resolved to one name per person."""
+  def __init__(self):
+    # Map keys, ('name', name), ('fold', folded_name) or ('email',
+    # address), to their parent key and, for the roots, to the size
+    # of their set.
+    self.parents = { }
+    self.sizes = { }
+    # Map names to how often they were used, in the order first seen.
+    self.uses = { }
+    # Map names to how much they are preferred to the others of their
+    # identity: 2 for the first names in contribulyze.aliases, 1 for
+    # committers' real names.
+    self.preferences = { }
+
+  def find(self, key):
+    """Return the root of KEY's set."""
+    parents = self.parents
+    if key not in parents:
+      parents[key] = key
+      self.sizes[key] = 1
+      return key
+    while parents[key] != key:
+      # Halve the path on the way, to keep later finds short.
+      parents[key] = parents[parents[key]]
+      key = parents[key]
+    return key
+
+  def union(self, key, other):
+    """Join the sets of KEY and OTHER."""
+    root = self.find(key)
+    other_root = self.find(other)
+    if root == other_root:
+      return
+    if self.sizes[root] < self.sizes[other_root]:
+      root, other_root = other_root, root
+    self.parents[other_root] = root
+    self.sizes[root] += self.sizes.pop(other_root)
+
+  def add_name(self, name, uses=1, preference=0):
+    """Record USES uses of NAME, preferred to the others of its identity
+    as much as PREFERENCE."""
+    if name not in self.uses:
+      self.uses[name] = 0
+      self.union(('name', name), ('fold', fold(name)))
+    self.uses[name] += uses
+    if preference > self.preferences.get(name, 0):
+      self.preferences[name] = preference
+
+  def add_email(self, name, email):
+    """Record that NAME used the address EMAIL."""
+    email = email.strip().lower()
+    if '@' not in email:
+      return
+    self.union(('name', name), ('email', email))
+    user, _, domain = email.partition('@')
+    if domain == 'apache.org':
+      self.add_name(user, 0)
+      self.union(('name', user), ('email', email))
+
+  def resolve(self):
+    """Return a dict mapping each name to the name of its identity: its
+    most preferred name, or failing that its most used one."""
+    best = { }
+    for name, uses in self.uses.items():
+      root = self.find(('name', name))
+      rank = (self.preferences.get(name, 0), uses)
+      if root not in best or rank > best[root][0]:
+        best[root] = (rank, name)
+    return dict((name, best[self.find(('name', name))][1]) for name in self.uses)
+
+  def suggestions(self):
+    """Return (name, alias) pairs of resolved names that look alike,
+    but were not found to be the same person."""
+    resolved = self.resolve()
+    look_alikes = { }
+    for name in self.uses:
+      if not self.uses[name]:
+        continue
+      for key in look_alike_keys(name):
+        look_alikes.setdefault(key, { })[resolved[name]] = True
+    pairs = { }
+    for names in look_alikes.values():
+      names = list(names)
+      for alias in names[1:]:
+        pairs[(names[0], alias)] = True
+    return list(pairs)
+
+# How many different names may use an email address before it is taken
+# to be shared by several people, and so not to identify anyone.
+shared_email_names = 3
+
+def resolve_identities(logs, aliases, committers):
+  """Return the Identities of the contributors to LOGS, given the lines
+  of contribulyze.aliases, ALIASES, and the (committer_id, real_name)
+  pairs of COMMITTERS."""
+  identities = Identities()
+  for line in aliases:
+    names = [name.strip() for name in line.split(',') if name.strip()]
+    if not names:
+      continue
+    identities.add_name(names[0], 0, 2)
+    for alias in names[1:]:
+      identities.add_name(alias, 0)
+      identities.union(('name', names[0]), ('name', alias))
+  for committer, name in committers:
+    identities.add_name(name, 0, 1)
+    identities.add_name(committer, 0)
+    identities.union(('name', name), ('name', committer))
+  users = { }
+  for log in logs:
+    for name in log.patchers:
+      identities.add_name(name)
+    for name in log.reviewers:
+      identities.add_name(name)
+    for name, email in log.emails:
+      users.setdefault(email.strip().lower(), { })[name] = True
+  for email, names in users.items():
+    if len(set(map(fold, names))) <= shared_email_names:
+      for name in names:
+        identities.add_email(name, email)
+  return identities
+
+def write_suggestions(identities, filename):
+  """Write the aliases suggested by IDENTITIES to FILENAME, in the form
+  of contribulyze.aliases lines."""
+  with open(filename, 'w', encoding='utf-8') as out:
+    for name, alias in identities.suggestions():
+      out.write('%s,%s\n' % (name, alias))
+
 
 ### Regexps to parse the logs. ##
-log_header_re = re.compile('^commit ([0-9a-z]+)$')
-patch_by_re = re.compile('(?:.*\n)*.*patch by ([^;]+)(;|,)', flags=re.IGNORECASE | re.MULTILINE)
-reviewed_by_re = re.compile('(?:.*\n)*.*[;, ](?:review|test)(?:ed)? by ((?:.|\n)+?)(?=(?: |\n)+for(?: |\n)+(?:cassandra-|#[0-9]+))', flags=re.IGNORECASE | re.MULTILINE)
-coauthored_by_re = re.compile(' *co-authored-by: ([^<]+)', re.IGNORECASE)
-author_re = re.compile('^Author: ([^<]+)')
-
-def graze(input):
-  line = input.readline()
-  log = None
-  while line != '':
-    m = log_header_re.match(line)
-    if not m:
-      sys.stderr.write('Could not match log message header.\n')
-      sys.stderr.write('Line was:\n')
-      sys.stderr.write("'%s'\n" % line)
+#
+# The fields are found by scanning for their keywords and then looking
+# for where each field ends, rather than with one regexp over the whole
+# message, which backtracks badly on long messages.  find_patch_by()
+# and find_reviewed_by() give exactly what the regexps
+#   (?:.*\n)*.*patch by ([^;]+)(;|,)
+#   (?:.*\n)*.*[;, ](?:review|test)(?:ed)? by ((?:.|\n)+?)(?=(?: |\n)+for(?: |\n)+(?:cassandra-|#[0-9]+))
+# matched with re.IGNORECASE, i.e., the last such field in the message.
+# Those regexps were matched against the messages as the default
+# `git log` format shows them, indented by four spaces, and without
+# their blank lines, which makes a difference to where fields end (a
+# "for CASSANDRA-NNNN" at the start of a line always followed some
+# spaces, for one), so the fields are still found in messages laid out
+# that way, see log_layout().
+patch_by_re = re.compile('patch by ', re.IGNORECASE)
+reviewed_by_re = re.compile('(?<=[;, ])(?:review|test)(?:ed)? by ', re.IGNORECASE)
+for_ticket_re = re.compile('(?<=[ \n])for[ \n]+(?:cassandra-|#[0-9]+)', re.IGNORECASE)
+coauthored_by_re = re.compile(' *co-authored-by: ([^<]+)(?:<([^>]*)>)?', re.IGNORECASE)
+author_re = re.compile('^([^<]+)(?:<([^>]*)>)?')
+
+name_separator_re = re.compile(',|&|( |\n)and( |\n)(by( |\n))?')
+
+def log_layout(message):
+  """Return MESSAGE as the default `git log` format shows it, indented
+  by four spaces, without its blank lines."""
+  return ''.join('    %s\n' % line for line in message.split('\n') if line)
+
+def find_patch_by(message):
+  """Return the names of the last "patch by" field in MESSAGE, laid
+  out by log_layout(), which end at the next ';', or failing that at
+  the last ',' in MESSAGE.  Return None if there is no such field."""
+  last_comma = message.rfind(',')
+  semicolon = -1
+  scanned = len(message)
+  for m in reversed(list(patch_by_re.finditer(message))):
+    start = m.end()
+    # Only the text up to where the previous search started needs
+    # searching, keeping this linear.
+    found = message.find(';', start, scanned)
+    if found != -1:
+      semicolon = found
+    scanned = start
+    end = semicolon if semicolon != -1 else last_comma
+    if end > start:
+      return message[start:end]
+  return None
+
+def find_reviewed_by(message):
+  """Return the names of the last "reviewed by" (or "review by",
+  "tested by", "test by") field in MESSAGE, laid out by log_layout(),
+  which end at the next "for CASSANDRA-NNNN" or "for #NNNN".  Return
+  None if there is no such field."""
+  tickets = [m.start() for m in for_ticket_re.finditer(message)]
+  if not tickets:
+    return None
+  for m in reversed(list(reviewed_by_re.finditer(message))):
+    start = m.end()
+    i = bisect.bisect_left(tickets, start + 2)
+    if i < len(tickets):
+      # The names end where the whitespace before "for" begins.
+      end = tickets[i] - 1
+      while end - 1 > start and message[end - 1] in ' \n':
+        end -= 1
+      return message[start:end]
+  return None
+
+def split_names(names):
+  """Return the names listed in NAMES (e.g., "A, B and C"), with their
+  whitespace normalized."""
+  return [" ".join(name.strip().split())
+          for name in name_separator_re.split(names)
+          if name and not name.isspace()]
+
+def parse_fields(log):
+  """Parse the names of LOG's patch authors and reviewers out of its
+  author line and message, storing them in LOG."""
+  patchers = [ ]
+  reviewers = [ ]
+  emails = [ ]
+  m = author_re.match(log.author)
+  if m:
+    patchers.append(" ".join(m.group(1).strip().split()))
+    if m.group(2):
+      emails.append((patchers[-1], m.group(2)))
+  for line in log.message.splitlines(True):
+    m = coauthored_by_re.match(line)
+    if m:
+      patchers.append(" ".join(m.group(1).strip().split()))
+      if m.group(2):
+        emails.append((patchers[-1], m.group(2)))
+  message = log_layout(log.message)
+  names = find_patch_by(message)
+  if names is not None:
+    patchers.extend(split_names(names))
+  names = find_reviewed_by(message)
+  if names is not None:
+    reviewers.extend(split_names(names))
+  log.patchers = tuple(map(sys.intern, patchers))
+  log.reviewers = tuple(map(sys.intern, reviewers))
+  log.emails = tuple((sys.intern(name), sys.intern(email)) for name, email in emails)
+
+def credit(log):
+  """Credit the contributors parsed out of LOG with their activity and
+  collaborations."""
+  if LogMessage.latest is None or log.date > LogMessage.latest.date:
+    LogMessage.latest = log
+  patch_field = Field("Patch")
+  review_field = Field("Review")
+  for field, names in (patch_field, log.patchers), (review_field, log.reviewers):
+    for name in names:
+      c = Contributor.get(name, None)
+      field.add_contributor(c)
+      c.add_activity(field, log)
+    if field.contributors:
+      log.add_field(field)
+  for c in patch_field.contributors | review_field.contributors:
+    c.add_collaboration(patch_field)
+    c.add_collaboration(review_field)
+
+# The `git log --format` read by graze().  Each commit is a record that
+# starts with a record separator (0x1e) and has its fields separated by
+# unit separators (0x1f): sha, author name, author email, author and
+# committer dates, and message.  Any --name-only paths follow the last
+# unit separator.  Unlike the default format, nothing in a message can
+# be mistaken for the start of the next commit.
+git_log_format = '%x1e%H%x1f%an%x1f%ae%x1f%aI%x1f%cI%x1f%B%x1f'
+
+def read_records(input, chunk_size=65536):
+  """Yield the records of the `git log --format=git_log_format` output
+  read from INPUT, as strings, without their record separators."""
+  pending = [ ]
+  while True:
+    chunk = input.read(chunk_size)
+    if not chunk:
+      break
+    records = chunk.split('\x1e')
+    if len(records) > 1:
+      pending.append(records[0])
+      yield ''.join(pending)
+      for record in records[1:-1]:
+        yield record
+      pending = [ ]
+    pending.append(records[-1])
+  yield ''.join(pending)
+
+def graze(input, repo=None, keep_messages=True):
+  """Parse the `git log --format=git_log_format` output read from
+  INPUT, and yield its LogMessages in the order they were read.  REPO
+  names the repository the log came from.  Unless KEEP_MESSAGES, the
+  messages are dropped once parsed, see load_message()."""
+  for record in read_records(input):
+    if not record:
+      continue
+    fields = record.split('\x1f')
+    if len(fields) != 7:
+      sys.stderr.write('Could not parse log record, was git log run with --format=%s?\n'
+                       % git_log_format)
+      sys.stderr.write('Record was:\n')
+      sys.stderr.write("'%s'\n" % record)
       sys.exit(1)
-    else:
-      log = LogMessage(m.group(1))
-      log.author = input.readline()
-      log.date = parser.parse(input.readline().replace('Date: ', ''))
-      if LogMessage.latest is None: LogMessage.latest = log.date
-      patch_field = Field("Patch")
-      review_field = Field("Review")
-      m = author_re.match(log.author)
-      if m:
-          c = Contributor.get(" ".join(m.group(1).strip().split()), None)
-          patch_field.add_contributor(c)
-          log.add_field(patch_field)
-          c.add_activity(patch_field, log)
-      # Parse the log message.
-      while line != '':
-        line = input.readline()
-        if line == '\n': continue
-        m = log_header_re.match(line)
-        if m:
-            # found a new commit, do regexp against existing log.message
-            m = patch_by_re.match(log.message)
-            if m:
-                authors = re.split(',|&|( |\n)and( |\n)(by( |\n))?', m.group(1))
-                for author in authors:
-                    if author and not author.isspace():
-                        c = Contributor.get(" ".join(author.strip().split()), None)
-                        patch_field.add_contributor(c)
-                        c.add_activity(patch_field, log)
-                log.add_field(patch_field)
-            m = reviewed_by_re.match(log.message)
-            if m:
-                reviewers = re.split(',|&|( |\n)and( |\n)(by( |\n))?', m.group(1))
-                for reviewer in reviewers:
-                    if reviewer and not reviewer.isspace():
-                        c = Contributor.get(" ".join(reviewer.strip().split()), None)
-                        review_field.add_contributor(c)
-                        c.add_activity(review_field, log)
-                log.add_field(review_field)
-            for c in patch_field.contributors:
-                c.add_collaboration(patch_field)
-                c.add_collaboration(review_field)
-            for c in review_field.contributors:
-                c.add_collaboration(patch_field)
-                c.add_collaboration(review_field)
-            break
-        m = coauthored_by_re.match(line)
-        if m:
-            c = Contributor.get(" ".join(m.group(1).strip().split()), None)
-            patch_field.add_contributor(c)
-            log.add_field(patch_field)
-            c.add_activity(patch_field, log)
-        log.accum(line)
+    sha, name, email, author_date, commit_date, message, paths = fields
+    log = LogMessage(sha, repo)
+    log.author = sys.intern('%s <%s>' % (name, email))
+    author_date = datetime.fromisoformat(author_date)
+    log.date = int(author_date.timestamp())
+    log.offset = int(author_date.utcoffset().total_seconds()) // 60
+    log.committed = int(datetime.fromisoformat(commit_date).timestamp())
+    log.message = message
+    log.paths = tuple(sys.intern(path) for path in paths.split('\n') if path)
+    parse_fields(log)
+    if not keep_messages:
+      log.message = None
+    yield log
 
 #
 # HTML output stuff.
@@ -579,7 +967,21 @@ def html_header(title, page_heading=None, highlight_targets=False):
 def html_footer():
   return '\n</body>\n</html>\n'
 
-def drop(title):
+def write_page(output_dir, path, page, hashes):
+  """Write PAGE to PATH, relative to OUTPUT_DIR, unless HASHES (a dict
+  of paths to the digests of the pages written on the last run) shows
+  that it is unchanged.  The page replaces any old one atomically, and
+  its digest is recorded in HASHES."""
+  digest = hashlib.sha1(page.encode('utf-8')).hexdigest()
+  filename = os.path.join(output_dir, path)
+  if hashes.get(path) == digest and os.path.exists(filename):
+    return
+  with open(filename + '.tmp', 'w', encoding='utf-8') as out:
+    out.write(page)
+  os.replace(filename + '.tmp', filename)
+  hashes[path] = digest
+
+def drop(title, output_dir='.'):
   # Output the data.
   #
   # The data structures are all linked up nicely to one another.  You
@@ -594,13 +996,20 @@ def drop(title):
     #print(LogMessage.all_logs[key])
 
   detail_subdir = "detail"
-  if not os.path.exists(detail_subdir):
-    os.mkdir(detail_subdir)
-
-  index = open('index.html', 'w')
-  index.write(html_header('Contributors %s' % title))
-  index.write(index_introduction % LogMessage.latest)
-  index.write('<ol>\n')
+  if not os.path.exists(os.path.join(output_dir, detail_subdir)):
+    os.makedirs(os.path.join(output_dir, detail_subdir))
+
+  # Pages are only rewritten if they changed since the last run.
+  hashes_file = os.path.join(output_dir, '.contribulyze-hashes')
+  hashes = { }
+  if os.path.exists(hashes_file):
+    with open(hashes_file) as hashes_input:
+      hashes = json.load(hashes_input)
+
+  index = [ ]
+  index.append(html_header('Contributors %s' % title))
+  index.append(index_introduction % (LogMessage.latest and LogMessage.latest.when()))
+  index.append('<ol>\n')
   # The same contributor appears under multiple keys, so uniquify.
   seen_contributors = { }
   # Sorting alphabetically is acceptable, but even better would be to
@@ -613,55 +1022,441 @@ def drop(title):
   for c in sorted_contributors:
     if c not in seen_contributors:
       urlpath = "%s/%s.html" % (detail_subdir, c.canonical_name())
-      fname = os.path.join(detail_subdir, "%s.html" % c.canonical_name())
       if c.score() > 0:
         # Don't even bother to print out full committers.  They are
         # a distraction from the purposes for which we're here.
         if not c.is_committer:
-          index.write('<li><p><a href="%s">%s</a>&nbsp;[%s]</p></li>\n'
-                      % (urllib_parse_quote(urlpath),
-                         c.big_name(html=True),
-                         c.score_str()))
-      c.html_out(fname, title)
+          index.append('<li><p><a href="%s">%s</a>&nbsp;[%s]</p></li>\n'
+                       % (urllib_parse_quote(urlpath),
+                          c.big_name(html=True),
+                          c.score_str()))
+      write_page(output_dir, urlpath, c.html_page(title), hashes)
       seen_contributors[c] = True
-  index.write('</ol>\n')
-  index.write(html_footer())
-  index.close()
+  index.append('</ol>\n')
+  index.append(html_footer())
+  write_page(output_dir, 'index.html', ''.join(index), hashes)
+
+  with open(hashes_file + '.tmp', 'w') as hashes_output:
+    json.dump(hashes, hashes_output)
+  os.replace(hashes_file + '.tmp', hashes_file)
+
+#
+# Commit store stuff.
+#
+# Parsing the whole history of every repository on every run is
+# wasteful, as only a handful of commits are new since the last run.
+# The commit store is an SQLite database holding every parsed commit,
+# and the last commit read, for each repository.
+#
+
+# Bump whenever parse_fields() changes, so stored commits get reparsed.
+store_version = 5
+
+def open_store(filename):
+  """Open, creating if needed, the commit store in FILENAME."""
+  store = sqlite3.connect(filename)
+  if store.execute('PRAGMA user_version').fetchone()[0] != store_version:
+    store.execute('DROP TABLE IF EXISTS commits')
+    store.execute('DROP TABLE IF EXISTS heads')
+    store.execute('PRAGMA user_version = %d' % store_version)
+  # seq orders each repository's commits as `git log` does, newest
+  # first, so that reading a store gives the same reports as git.
+  store.execute('CREATE TABLE IF NOT EXISTS commits ('
+                ' repo TEXT, seq INTEGER, sha TEXT, author TEXT,'
+                ' date INTEGER, offset INTEGER, committed INTEGER,'
+                ' message TEXT, paths TEXT, patchers TEXT, reviewers TEXT, emails TEXT,'
+                ' PRIMARY KEY (repo, seq))')
+  store.execute('CREATE TABLE IF NOT EXISTS heads (repo TEXT PRIMARY KEY, sha TEXT)')
+  return store
+
+def load_head(store, repo):
+  """Return the last commit of REPO read into STORE, or None."""
+  row = store.execute('SELECT sha FROM heads WHERE repo = ?', (repo,)).fetchone()
+  return row[0] if row else None
+
+def forget_logs(store, repo):
+  """Remove everything stored for REPO from STORE."""
+  with store:
+    store.execute('DELETE FROM commits WHERE repo = ?', (repo,))
+    store.execute('DELETE FROM heads WHERE repo = ?', (repo,))
+
+def save_logs(store, repo, head, logs):
+  """Add LOGS, newest first, to REPO's commits in STORE, and record
+  HEAD as the last commit read."""
+  seq = store.execute('SELECT COALESCE(MAX(seq), 0) FROM commits WHERE repo = ?',
+                      (repo,)).fetchone()[0] + len(logs)
+  with store:
+    for log in logs:
+      store.execute('INSERT INTO commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (repo, seq, log.sha, log.author, log.date, log.offset,
+                     log.committed, log.message, json.dumps(log.paths),
+                     json.dumps(log.patchers), json.dumps(log.reviewers),
+                     json.dumps(log.emails)))
+      seq -= 1
+    store.execute('INSERT OR REPLACE INTO heads VALUES (?, ?)', (repo, head))
+
+def load_logs(store, repo, keep_messages=True):
+  """Return REPO's LogMessages from STORE, in `git log` order.  Unless
+  KEEP_MESSAGES, the messages are left to load_message()."""
+  logs = [ ]
+  message = 'message' if keep_messages else 'NULL'
+  for row in store.execute('SELECT sha, author, date, offset, committed, %s, paths, patchers, reviewers, emails'
+                           ' FROM commits WHERE repo = ? ORDER BY seq DESC' % message, (repo,)):
+    log = LogMessage(row[0], repo)
+    log.author = sys.intern(row[1])
+    log.date = row[2]
+    log.offset = row[3]
+    log.committed = row[4]
+    log.message = row[5]
+    log.paths = tuple(map(sys.intern, json.loads(row[6])))
+    log.patchers = tuple(map(sys.intern, json.loads(row[7])))
+    log.reviewers = tuple(map(sys.intern, json.loads(row[8])))
+    log.emails = tuple((sys.intern(name), sys.intern(email)) for name, email in json.loads(row[9]))
+    logs.append(log)
+  return logs
+
+#
+# Multi-report stuff.
+#
+# Rather than piping one `git log` into this script per report, all
+# the reports can be made in one go from the cloned repositories.  Each
+# repository's log is read once, with the paths touched by each commit,
+# and every report is then drawn from that in-memory index of commits.
+#
+
+# The periods reported on, with the `git log --since` date for each.
+periods = (('all_time', 'last 50 years'),
+           ('last_3_years', 'last 3 years'),
+           ('last_6_months', 'last 6 months'),
+           ('last_1_month', 'last 1 month'))
+
+def read_groups(groups_input):
+  """Read the report groups from GROUPS_INPUT, one per line in the form
+  "group,repo[/path],...".  Blank lines and '#' comments are ignored.
+  Return a list of (group, groupings) tuples, where groupings is a
+  list of (repo, path) tuples, path being None for the whole repo."""
+  groups = [ ]
+  for line in groups_input:
+    line = line.split('#', 1)[0].strip()
+    if not line:
+      continue
+    fields = [field.strip() for field in line.split(',')]
+    groupings = [ ]
+    for grouping in fields[1:]:
+      repo, _, path = grouping.partition('/')
+      groupings.append((repo, path or None))
+    groups.append((fields[0], groupings))
+  return groups
+
+def git(repo_dir, *args):
+  """Run git with ARGS in REPO_DIR, returning its exit status and output."""
+  result = subprocess.run(('git',) + args, cwd=repo_dir,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+  return result.returncode, result.stdout.strip()
+
+def period_start(repo_dir, since):
+  """Return the time, in seconds since the epoch, that
+  `git log --since=SINCE` would stop at, asking git in REPO_DIR so
+  that its approxidate rules are followed."""
+  max_age = git(repo_dir, 'rev-parse', '--since=%s' % since)[1]
+  return int(max_age.split('=')[1])
+
+def read_log(repo_dir, repo, revisions, keep_messages=True):
+  """Read the `git log` of REVISIONS in REPO_DIR, the clone of REPO,
+  and return its LogMessages, keeping their messages if KEEP_MESSAGES.
+  This is run in a worker process."""
+  git_log = subprocess.Popen(['git', 'log', '--no-merges', '--name-only',
+                              '--format=' + git_log_format, revisions],
+                             cwd=repo_dir,
+                             stdout=subprocess.PIPE,
+                             encoding='utf-8', errors='replace')
+  logs = list(graze(git_log.stdout, repo, keep_messages))
+  if git_log.wait() != 0:
+    complain('git log failed in %s\n' % repo_dir, True)
+  return logs
+
+def ingest(repos_dir, repos, store=None, jobs=None, keep_messages=True):
+  """Read the logs of REPOS, clones in REPOS_DIR, and return a dict of
+  repo names to lists of LogMessages.  The logs are read and parsed
+  concurrently, by up to JOBS worker processes.  If STORE is given,
+  only the commits made since the last run are read from git, and the
+  rest come from STORE.  Unless KEEP_MESSAGES, the messages are left
+  to load_message()."""
+  index = { }
+  with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+    reading = { }
+    for repo in repos:
+      repo_dir = os.path.join(repos_dir, repo)
+      revisions = head = 'HEAD'
+      if store:
+        head = git(repo_dir, 'rev-parse', 'HEAD')[1]
+        stored_head = load_head(store, repo)
+        if stored_head == head:
+          index[repo] = load_logs(store, repo, keep_messages)
+          continue
+        if stored_head and git(repo_dir, 'merge-base', '--is-ancestor', stored_head, head)[0] == 0:
+          revisions = '%s..%s' % (stored_head, head)
+        else:
+          # Nothing stored, or the history was rewritten; start over.
+          forget_logs(store, repo)
+          revisions = head
+      # The store needs the messages, even if they are not kept.
+      reading[repo] = (head, pool.submit(read_log, repo_dir, repo, revisions,
+                                         keep_messages or store is not None))
+    # The results are gathered, and stored, in the order of REPOS.
+    for repo in repos:
+      if repo not in reading:
+        continue
+      head, logs = reading[repo][0], reading[repo][1].result()
+      if store:
+        save_logs(store, repo, head, logs)
+        logs = load_logs(store, repo, keep_messages)
+      index[repo] = logs
+  return dict((repo, index[repo]) for repo in repos)
+
+# Unless the messages are kept, they are read back from the clones in
+# messages_dir when rendering, by one `git cat-file --batch` process
+# per repository.
+messages_dir = None
+cat_files = { }
+
+def load_message(log):
+  """Return LOG's message, reading it from git if it was not kept."""
+  if log.message is not None:
+    return log.message
+  cat_file = cat_files.get(log.repo)
+  if cat_file is None:
+    cat_file = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                cwd=os.path.join(messages_dir, log.repo),
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    cat_files[log.repo] = cat_file
+  cat_file.stdin.write(log.sha.encode('ascii') + b'\n')
+  cat_file.stdin.flush()
+  size = int(cat_file.stdout.readline().split()[2])
+  commit = cat_file.stdout.read(size + 1)[:size]
+  # The message follows the commit's headers and a blank line.
+  return commit.partition(b'\n\n')[2].decode('utf-8', 'replace')
+
+def memory_report(what):
+  """Report the peak memory use of this process, and of the largest of
+  the processes it has waited for, after WHAT.  Those are the workers and
+  also the git processes they and this one ran, which the OS doesn't tell
+  apart."""
+  own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+  complain('%s: peak RSS %d MiB, largest child process %d MiB\n'
+           % (what, own // 1024, children // 1024))
+
+def touches(log, path):
+  """Return whether LOG touched anything under PATH (None for anything)."""
+  if path is None:
+    return True
+  prefix = path + '/'
+  for log_path in log.paths:
+    if log_path == path or log_path.startswith(prefix):
+      return True
+  return False
+
+def select(index, groupings, since):
+  """Return the LogMessages in INDEX, a dict of repo names to lists of
+  LogMessages, that touched any of GROUPINGS and are not older than
+  SINCE.  Each commit is returned once, in the order of GROUPINGS."""
+  selected = { }
+  for repo, path in groupings:
+    for log in index.get(repo, ()):
+      if since is not None and log.committed < since:
+        continue
+      if log.sha not in selected and touches(log, path):
+        selected[log.sha] = log
+  return list(selected.values())
+
+def report_all(repos_dir, groups, aliases, committers, store=None, jobs=None,
+               keep_messages=True, memory=False, suggestions_file=None):
+  """Create the reports for all GROUPS and periods, from the clones
+  in REPOS_DIR, under 'subcomponents' in the current directory.
+  STORE, if given, is the commit store to read and update.  JOBS is
+  the number of worker processes to use (by default, one per CPU).
+  Unless KEEP_MESSAGES, messages are only read from git when rendered.
+  If MEMORY, report the memory used.  If SUGGESTIONS_FILE is given,
+  write the suggested aliases to it."""
+  repos = [ ]
+  missing = [ ]
+  for group, groupings in groups:
+    for repo, path in groupings:
+      if repo in repos or repo in missing:
+        continue
+      if os.path.isdir(os.path.join(repos_dir, repo)):
+        repos.append(repo)
+      else:
+        missing.append(repo)
+        complain('No clone of %s found in %s, skipping it.\n' % (repo, repos_dir))
+  if not repos:
+    complain('No clones of any of the repositories in the groups found in %s.\n'
+             % repos_dir, True)
+  index = ingest(repos_dir, repos, store, jobs, keep_messages)
+  if memory:
+    memory_report('Read %d commits' % sum(len(logs) for logs in index.values()))
+  identities = resolve_identities((log for logs in index.values() for log in logs),
+                                  aliases, committers)
+  if suggestions_file:
+    write_suggestions(identities, suggestions_file)
+
+  # Any repository will do to ask git when the periods start.
+  repo_dir = os.path.join(repos_dir, repos[0])
+  starts = dict((period, period_start(repo_dir, since)) for period, since in periods)
+  # Each report is made by a worker process, from its own copy of the
+  # index and with its own contributors.
+  with concurrent.futures.ProcessPoolExecutor(jobs, initializer=init_reports,
+                                              initargs=(index, aliases, committers,
+                                                        identities.resolve(), repos_dir)) as pool:
+    reports = [pool.submit(report, group, groupings, period, starts[period])
+               for group, groupings in groups
+               for period, since in periods]
+    for future in reports:
+      future.result()
+  if memory:
+    memory_report('Made %d reports' % len(reports))
+
+# What report() works from, set up in each worker by init_reports().
+report_index = None
+report_aliases = None
+report_committers = None
+
+def init_reports(index, aliases, committers, resolved_names, repos_dir):
+  global report_index, report_aliases, report_committers, messages_dir
+  report_index = index
+  report_aliases = aliases
+  report_committers = committers
+  Contributor.resolved_names = resolved_names
+  messages_dir = repos_dir
+
+def report(group, groupings, period, start):
+  """Create the report of GROUP, made of GROUPINGS, for PERIOD, which
+  covers the commits made since START."""
+  logs = select(report_index, groupings, start)
+  reset()
+  process_aliases(report_aliases)
+  process_committers(report_committers)
+  for log in logs:
+    credit(log)
+  drop('%s %s' % (group.replace('..', ''), period.replace('_', ' ')),
+       os.path.join('subcomponents', group, period))
 
 #
 # Main stuff.
 #
 
+def complain(msg, fatal=False):
+  """Print MSG as a mild complaint, or if FATAL is true, print it as an
+  error and exit."""
+  sys.stderr.write(msg)
+  sys.stderr.flush()
+  if fatal:
+    sys.exit(1)
+
 def usage():
-  print('USAGE: git log --no-merges | %s [-t title]' \
+  print("USAGE: git log --no-merges --format='%s' | %s [-t title]" \
+        % (git_log_format, os.path.basename(sys.argv[0])))
+  print('       %s -r repos_dir [-g groups_file] [-s store_file] [-j jobs] [-l] [-m]' \
         % os.path.basename(sys.argv[0]))
+  print('Options: [--roster-file roster_file [--roster-ttl seconds]]')
+  print('         [--suggest-aliases suggestions_file]')
   print('')
   print('Create HTML files in the current directory, rooted at index.html,')
   print('in which you can browse to see who contributed what.')
   print('')
+  print('With -r, read the logs of the repositories cloned in repos_dir')
+  print('and create the reports for every group in groups_file (by default')
+  print('contribulyze.groups) and period, under subcomponents/<group>/<period>.')
+  print('The repositories are read, and the reports made, concurrently by')
+  print('up to jobs processes (by default, one per CPU).  Pages unchanged')
+  print('since the last run in the same directory are not rewritten.')
+  print('With -s, keep the parsed commits in store_file, so that later runs')
+  print('only need to parse the commits made since.')
+  print('With -l, do not keep log messages in memory, but read them back from')
+  print('the repositories when rendering.  With -m, report the peak memory used.')
+  print('')
+  print('The committer roster is fetched from whimsy, unless --roster-file is')
+  print('given.  If roster_file exists, it is used as is, or with --roster-ttl')
+  print('fetched again once older than that many seconds (and only if whimsy')
+  print('changed it).  A fetched roster is saved to roster_file.')
+  print('')
+  print('With --suggest-aliases, write the names that look like each other,')
+  print('but could not be resolved to the same person, to suggestions_file as')
+  print('contribulyze.aliases lines to review.')
+  print('')
 
 
 def main():
   try:
-    opts, args = my_getopt(sys.argv[1:], 't:hH?', [ 'help' ])
+    opts, args = my_getopt(sys.argv[1:], 't:r:g:s:j:lmhH?', [ 'help', 'roster-file=', 'roster-ttl=',
+                                                            'suggest-aliases=' ])
   except getopt.GetoptError as e:
     complain(str(e) + '\n\n')
     usage()
     sys.exit(1)
 
+  script_dir = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
   # Parse options.
   title = ''
+  repos_dir = None
+  store_file = None
+  jobs = None
+  keep_messages = True
+  memory = False
+  roster_file = None
+  roster_ttl = None
+  suggestions_file = None
+  groups_file = os.path.join(script_dir, 'contribulyze.groups')
   for opt, value in opts:
     if opt in ('--help', '-h', '-H', '-?'):
       usage()
       sys.exit(0)
     elif opt == '-t':
       title = value
+    elif opt == '-r':
+      repos_dir = value
+    elif opt == '-g':
+      groups_file = value
+    elif opt == '-s':
+      store_file = value
+    elif opt == '-j':
+      jobs = int(value)
+    elif opt == '-l':
+      keep_messages = False
+    elif opt == '-m':
+      memory = True
+    elif opt == '--roster-file':
+      roster_file = value
+    elif opt == '--roster-ttl':
+      roster_ttl = int(value)
+    elif opt == '--suggest-aliases':
+      suggestions_file = value
 
   # Gather the data.
-  process_aliases(open(os.path.join(os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__))),'contribulyze.aliases')))
-  process_committers()
-  graze(sys.stdin)
+  with open(os.path.join(script_dir, 'contribulyze.aliases')) as aliases_input:
+    aliases = aliases_input.readlines()
+  committers = fetch_committers(roster_file, roster_ttl)
+
+  if repos_dir:
+    with open(groups_file) as groups_input:
+      groups = read_groups(groups_input)
+    store = open_store(store_file) if store_file else None
+    report_all(repos_dir, groups, aliases, committers, store, jobs,
+               keep_messages, memory, suggestions_file)
+    return
+
+  logs = list(graze(sys.stdin))
+  identities = resolve_identities(logs, aliases, committers)
+  if suggestions_file:
+    write_suggestions(identities, suggestions_file)
+  Contributor.resolved_names = identities.resolve()
+  process_aliases(aliases)
+  process_committers(committers)
+  for log in logs:
+    credit(log)
 
   # Output the data.
   drop(title)
@@ -27,4 +27,8 @@ du -mh / 2>/dev/null | sort -rh | head -n 30
 echo
 df -h
 echo
-docker system df -v
\ No newline at end of file
+docker system df -v
+if [ -f docker_image_pruner.json ] ; then
+    echo
+    echo "docker_image_pruner summary: $(cat docker_image_pruner.json)"
+fi
\ No newline at end of file
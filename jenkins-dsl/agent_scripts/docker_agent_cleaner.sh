@@ -50,5 +50,6 @@ fi;
 virtualenv -p python3 -q .venv
 source .venv/bin/activate
 pip -q install requests
-python docker_image_pruner.py
+rm -f docker_image_pruner.json
+python docker_image_pruner.py --summary docker_image_pruner.json
 deactivate
\ No newline at end of file
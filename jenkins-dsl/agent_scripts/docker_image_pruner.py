@@ -15,48 +15,313 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# Removes all apache/cassandra_ in-tree test images that are not from branch HEADs
+# Prunes apache/cassandra_ in-tree test images not from branch HEADs: those unused for a while, and then the least
+#  recently used until enough disk is free. Images from branch HEADs are always kept
 
+import argparse
 import subprocess
 import hashlib
+import json
 import os
+import re
 import requests
+import shutil
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+BRANCHES = ['cassandra-4.0', 'cassandra-4.1', 'cassandra-5.0', 'trunk']
+DOCKERFILE_URL = "https://raw.githubusercontent.com/apache/cassandra/{branch}/.build/docker/{dockerfile}"
+DIGEST_CACHE = os.path.expanduser('~/.cache/cassandra-builds/dockerfile_digests.json')
+USAGE_CACHE = os.path.expanduser('~/.cache/cassandra-builds/image_usage.json')
+# evict until this much of the disk docker uses is free
+MIN_FREE_PERCENT = 20
+# images not at a branch HEAD and unused for longer than this are pruned however much disk is free
+MAX_AGE_DAYS = 7
+# the date, the time to the second and the UTC offset of a docker timestamp, skipping any fraction of a second
+timestamp_re = re.compile(r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:\.\d+)?\s*(Z|[+-]\d{2}:?\d{2})?')
+FETCH_WORKERS = 8
+# images removed in each docker rmi, and how many of those to run at once
+RMI_BATCH = 16
+RMI_WORKERS = 4
+FETCH_TIMEOUT = 30
 
 # str.removeprefix not available until python3.9
 def remove_prefix(input_string, prefix):
     return input_string[len(prefix):] if prefix and input_string.startswith(prefix) else input_string
 
-def prune_docker_images():
-
-    docker_images = subprocess.run(['docker', 'images', '--filter', 'reference=apache/cassandra*', '--format', '{{.Repository}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+def prune_docker_images(branches=BRANCHES, git_repo=None, digest_cache=DIGEST_CACHE, min_free_percent=MIN_FREE_PERCENT,
+                        max_age_days=MAX_AGE_DAYS, usage_cache=USAGE_CACHE, dry_run=False):
+    """ returns a summary of what was pruned, or would be with dry_run, and what went wrong """
 
-    debug(f"found images: {docker_images}")
-    md5sums = set()
-    for branch in ['cassandra-5.0','trunk']:
-        for docker_image in docker_images:
-            dockerfile=remove_prefix(docker_image,'apache/cassandra-')
-            debug(f"checking {branch}/.build/docker/{dockerfile}")
-            md5sums.add(fetch_url_md5sum(f"https://raw.githubusercontent.com/apache/cassandra/{branch}/.build/docker/{dockerfile}"))
+    start = time.time()
+    summary = {'dry_run': dry_run, 'images_removed': 0, 'tags_removed': 0, 'bytes_reclaimed': 0, 'failures': []}
+    docker_images = list_docker_images()
+    debug(f"local images are: {docker_images}")
+    if not docker_images:
+        return finish_summary(summary, start)
 
+    # in-tree images are named apache/cassandra-<dockerfile without .docker>:<md5sum of dockerfile>
+    #  so each dockerfile only needs a digest once per branch, however many tags it has
+    dockerfiles = sorted({remove_prefix(docker_tag.rsplit(':', 1)[0], 'apache/cassandra-') + '.docker' for docker_tag in docker_images})
+    if git_repo:
+        md5sums = set(filter(None, git_md5sums(git_repo, branches, dockerfiles)))
+    else:
+        md5sums = set(filter(None, fetch_md5sums(branches, dockerfiles, digest_cache)))
 
-    if 0 < len(md5sums):
+    if 0 == len(md5sums):
+        summary['failures'].append('no dockerfiles found on any branch, so not pruning')
+    else:
         debug(f"in use md5sums are: {md5sums}")
 
-        docker_tags = subprocess.run(['docker', 'images', '--filter', 'reference=apache/cassandra*', '--format', '{{.Repository}}:{{.Tag}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+        images = inspect_images(docker_images)
+        last_used = record_usage(usage_cache, docker_images, images, dry_run)
+        current = {image_id for docker_tag, image_id in docker_images.items() if docker_tag.rsplit(':', 1)[1] in md5sums or image_id in md5sums}
+        free, total = disk_usage(docker_root_dir())
+        target = total * min_free_percent / 100
+        debug(f"{free} of {total} bytes free, want {target}")
+
+        # evicting by images' sizes overstates what is freed when they share layers, so after each round of removals
+        #  measure what was, and go another round with the rest if that wasn't enough. a disk filled by more than docker
+        #  may never get to the target, so stop once a round frees nothing
+        remaining = eviction_order(images, last_used, current, max_age_days)
+        reclaimed = 0
+        while remaining:
+            evictions = plan_evictions(remaining, images, last_used, current, max_age_days, free + reclaimed, target)
+            if not evictions:
+                break
+            remaining = remaining[len(evictions):]
+            for image_id in evictions:
+                reason = 'expired' if expired(image_id, last_used, current, max_age_days) else 'disk pressure'
+                print(f"{'Would prune' if dry_run else 'Pruning'} {' '.join(images[image_id]['tags'])} ({images[image_id]['size']} bytes, {reason})")
+            if dry_run:
+                summary['images_removed'] += len(evictions)
+                summary['tags_removed'] += sum(len(images[image_id]['tags']) for image_id in evictions)
+                reclaimed += sum(images[image_id]['size'] for image_id in evictions)
+                continue
+            untagged, failures = remove_images([images[image_id]['tags'] for image_id in evictions])
+            summary['images_removed'] += sum(1 for image_id in evictions if untagged.issuperset(images[image_id]['tags']))
+            summary['tags_removed'] += len(untagged)
+            summary['failures'] += failures
+            # the layers only the removed images used are left dangling
+            prune = subprocess.run(['docker', 'image', 'prune', '--force'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            if 0 != prune.returncode:
+                summary['failures'].append(prune.stderr.strip())
+            freed_before = reclaimed
+            reclaimed = max(0, disk_usage(docker_root_dir())[0] - free)
+            if not untagged or reclaimed <= freed_before:
+                break
+
+        print(f"{'Would reclaim' if dry_run else 'Reclaimed'} {reclaimed} bytes, {free + reclaimed} of {total} bytes free, wanted {int(target)}")
+        summary.update({'bytes_reclaimed': reclaimed, 'bytes_free': free + reclaimed, 'bytes_total': total, 'bytes_wanted_free': int(target)})
+
+    return finish_summary(summary, start)
+
+def finish_summary(summary, start):
+    summary['wall_time'] = round(time.time() - start, 3)
+    return summary
+
+def plan_evictions(order, images, last_used, current, max_age_days, free, target):
+    """ the leading images of order to evict for free to reach target, going by their sizes, along with any expired """
+    evictions = []
+    for image_id in order:
+        if free >= target and not expired(image_id, last_used, current, max_age_days):
+            break
+        evictions.append(image_id)
+        free += images[image_id]['size']
+    return evictions
+
+def remove_images(images_tags):
+    """
+    Removes the images, each as the list of its tags, RMI_BATCH at a time in each docker rmi and RMI_WORKERS of those at
+    once. A failure to remove one tag doesn't stop the rest of its batch.
+    :return: the tags removed, and the errors for those that weren't
+    """
+    batches = [sum(images_tags[i:i + RMI_BATCH], []) for i in range(0, len(images_tags), RMI_BATCH)]
+    with ThreadPoolExecutor(max_workers=RMI_WORKERS) as executor:
+        results = list(executor.map(lambda tags: subprocess.run(['docker', 'rmi'] + tags, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True), batches))
+    untagged = set()
+    failures = []
+    for result in results:
+        debug(result.stdout)
+        untagged.update(remove_prefix(line, 'Untagged: ') for line in result.stdout.splitlines() if line.startswith('Untagged: '))
+        failures += [line for line in result.stderr.splitlines() if line.strip()]
+    return untagged, failures
+
+def eviction_order(images, last_used, current, max_age_days):
+    """
+    Images in the order to evict them: the expired first, those not at any branch HEAD that haven't been used in
+    max_age_days, then the least recently used of the rest. Images at a branch HEAD are never evicted, as those are
+    what the next jobs need and rebuilding one costs each of them the most.
+    """
+    def key(image_id):
+        return (not expired(image_id, last_used, current, max_age_days), last_used[image_id], image_id)
+    return sorted((image_id for image_id in images if image_id not in current), key=key)
+
+def expired(image_id, last_used, current, max_age_days):
+    return image_id not in current and last_used[image_id] < time.time() - max_age_days * 24 * 60 * 60
+
+def inspect_images(docker_images):
+    """ size in bytes, creation time and tags of each image ID, from the one docker call """
+    image_ids = sorted(set(docker_images.values()))
+    lines = subprocess.run(['docker', 'image', 'inspect', '--format', '{{.Id}} {{.Size}} {{.Created}}'] + image_ids, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+    images = {}
+    for line in lines:
+        image_id, size, created = line.split(' ', 2)
+        images[image_id] = {'size': int(size), 'created': parse_time(created), 'tags': []}
+    for docker_tag, image_id in sorted(docker_images.items()):
+        if image_id in images:
+            images[image_id]['tags'].append(docker_tag)
+    return images
+
+def record_usage(usage_cache, docker_images, images, dry_run):
+    """
+    When each image was last used, kept in the usage cache across runs as containers come and go. An image is used
+    when a container is created from it, or failing that, when it was built.
+    """
+    usage = load_json(usage_cache)
+    lines = subprocess.run(['docker', 'ps', '--all', '--no-trunc', '--format', '{{.Image}}\t{{.CreatedAt}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+    for line in lines:
+        image, created = line.split('\t', 1)
+        image_id = docker_images.get(image, image)
+        if image_id in images:
+            usage[image_id] = max(usage.get(image_id, 0), parse_time(created))
+    last_used = {image_id: max(usage.get(image_id, 0), image['created']) for image_id, image in images.items()}
+    if not dry_run:
+        # forget the images no longer here
+        save_json(usage_cache, {image_id: usage[image_id] for image_id in images if image_id in usage})
+    return last_used
+
+def parse_time(timestamp):
+    """
+    seconds since the epoch of docker's timestamps, like inspect's 2024-10-17T12:34:56.123456789Z and ps's
+     2024-10-17 14:34:56 +0200 CEST, which is in the host's timezone. strptime can't take the nanoseconds or the zone
+     name, so only the seconds and the offset are used
+    """
+    match = timestamp_re.match(timestamp)
+    if match is None:
+        raise ValueError(f"unrecognised docker timestamp {timestamp}")
+    date, seconds, offset = match.groups()
+    return datetime.strptime(f"{date}T{seconds}{offset or 'Z'}", '%Y-%m-%dT%H:%M:%S%z').timestamp()
+
+def docker_root_dir():
+    return subprocess.run(['docker', 'info', '--format', '{{.DockerRootDir}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.strip() or '/'
+
+def disk_usage(path):
+    """ free and total bytes of the filesystem holding path, or its nearest parent we are allowed to look at """
+    while True:
+        try:
+            usage = shutil.disk_usage(path)
+            return usage.free, usage.total
+        except OSError:
+            if path == os.path.dirname(path):
+                raise
+            path = os.path.dirname(path)
+
+def list_docker_images():
+    """ all tagged apache/cassandra* images as repository:tag to image ID, from the one docker call """
+    lines = subprocess.run(['docker', 'images', '--no-trunc', '--filter', 'reference=apache/cassandra*', '--format', '{{.Repository}}:{{.Tag}} {{.ID}}'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+    docker_images = {}
+    for line in lines:
+        docker_tag, image_id = line.split(' ', 1)
+        # untagged images can't be removed by tag
+        if not docker_tag.endswith(':<none>'):
+            docker_images[docker_tag] = image_id
+    return docker_images
+
+def git_md5sums(git_repo, branches, dockerfiles):
+    """ md5sums of the dockerfiles on each branch of a local cassandra checkout, for agents without network access """
+    md5sums = []
+    for branch in branches:
+        ref = git_ref(git_repo, branch)
+        for dockerfile in dockerfiles:
+            debug(f"checking {ref}:.build/docker/{dockerfile} in {git_repo}")
+            show = subprocess.run(['git', '-C', git_repo, 'show', f"{ref}:.build/docker/{dockerfile}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # a dockerfile the branch doesn't have
+            md5sums.append(hashlib.md5(show.stdout).hexdigest() if 0 == show.returncode else None)
+    return md5sums
+
+def git_ref(git_repo, branch):
+    """ the remote-tracking branch if there is one, as that's what a fetch keeps up to date, otherwise the local branch """
+    for ref in [f"origin/{branch}", branch]:
+        if 0 == subprocess.run(['git', '-C', git_repo, 'rev-parse', '--verify', '--quiet', ref], stdout=subprocess.DEVNULL).returncode:
+            return ref
+    # pruning without this branch's dockerfiles would remove images still in use
+    raise ValueError(f"no branch {branch} in {git_repo}")
+
+def fetch_md5sums(branches, dockerfiles, digest_cache):
+    """
+    md5sums of the dockerfiles on each branch, fetched concurrently over one pooled session.
+    Each fetch is revalidated against the digest cache with its ETag, so an unchanged dockerfile isn't downloaded again.
+    """
+    cache = load_json(digest_cache)
+    keys = [f"{branch}/{dockerfile}" for branch in branches for dockerfile in dockerfiles]
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_WORKERS))
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            entries = list(executor.map(lambda key: fetch_digest(session, key, cache.get(key)), keys))
+    cache.update(zip(keys, entries))
+    save_json(digest_cache, cache)
+    return [entry['md5sum'] for entry in entries]
+
+def fetch_digest(session, key, cached):
+    """ the cache entry for branch/dockerfile, with an md5sum of None if the branch has no such dockerfile """
+    branch, dockerfile = key.split('/', 1)
+    url = DOCKERFILE_URL.format(branch=branch, dockerfile=dockerfile)
+    headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+    try:
+        response = session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        if response.status_code == 304:
+            debug(f"unchanged {url}")
+            return cached
+        debug(f"fetched {url}")
+        if response.status_code == 404:
+            return {'etag': None, 'md5sum': None}
+        response.raise_for_status()
+    except requests.RequestException as e:
+        # the last md5sum we had is a better guess than none, otherwise it's raised rather than pruning without it
+        if cached is None:
+            raise
+        print(f"WARN failed to fetch {url}, using its cached md5sum: {e}", file=sys.stderr)
+        return cached
+    return {'etag': response.headers.get('ETag'), 'md5sum': hashlib.md5(response.content).hexdigest()}
 
-        debug(f"local images are: {docker_tags}")
-        for docker_tag in docker_tags:
-            debug(docker_tag)
-            if subprocess.run(['docker', 'image', 'inspect', '--format', '{{.Id}}', docker_tag], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True).stdout.strip() not in md5sums:
-                print(f"Pruning {docker_tag}")
-                subprocess.run(['docker', 'rmi', docker_tag], check=False)
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # missing or unreadable, it only costs a cold cache
+        return {}
 
-def fetch_url_md5sum(url):
-    return hashlib.md5(requests.get(url).content).hexdigest()
+def save_json(path, cache):
+    """ written aside and renamed over, so agents cleaning at the same time never read half a cache """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
 
 def debug(line):
     if 'DEBUG' in os.environ:
         print(line)
 
 if __name__ == "__main__":
-    prune_docker_images()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Prunes apache/cassandra_ in-tree test images not from branch HEADs, when unused for a while or by least recent use until enough disk is free')
+    parser.add_argument('--branches', type=str, default=','.join(BRANCHES), help='Comma separated branches whose images are kept')
+    parser.add_argument('--git-repo', type=str, help='Cassandra checkout to read the dockerfiles from, instead of fetching them from github')
+    parser.add_argument('--digest-cache', type=str, default=DIGEST_CACHE, help='File caching the fetched dockerfile md5sums')
+    parser.add_argument('--min-free-percent', type=float, default=MIN_FREE_PERCENT, help='Evict images until this much of the disk is free')
+    parser.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS, help='Evict images not at a branch HEAD and unused for this long regardless')
+    parser.add_argument('--usage-cache', type=str, default=USAGE_CACHE, help='File recording when each image was last used')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be pruned, and the bytes it would reclaim')
+    parser.add_argument('--summary', type=str, help='File to write a JSON summary of the pruning to, for agent_report.sh')
+    args = parser.parse_args()
+    summary = prune_docker_images(args.branches.split(','), args.git_repo, args.digest_cache, args.min_free_percent, args.max_age_days, args.usage_cache, args.dry_run)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, sort_keys=True)
+            f.write('\n')
\ No newline at end of file
@@ -1454,7 +1454,7 @@ job('contribulyze') {
         buildDescription('', buildDescStr)
         shell("""
                 mkdir -p build/html ; chmod -R 777 build/html
-                docker run -t -v`pwd`/build/html:/tmp/contribulyze-html -v`pwd`/contribulyze:/contribulyze apache/cassandra-testing-ubuntu2004-java11-w-dependencies bash -lc 'pip3 install --quiet python-dateutil ; cd /contribulyze ; bash contribulyze.sh '
+                docker run -t -v`pwd`/build/html:/tmp/contribulyze-html -v`pwd`/contribulyze:/contribulyze apache/cassandra-testing-ubuntu2004-java11-w-dependencies bash -lc 'cd /contribulyze ; bash contribulyze.sh '
               """)
     }
     publishers {
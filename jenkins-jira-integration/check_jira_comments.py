@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+# Checks the paging of JIRA comments in jenkins_jira_integration.py offline, with the python-jira installed, against a
+# fake JIRA that returns fewer comments a page than asked for, as JIRA may, and that a branch's comment is updated as it
+# was fetched, without fetching it again.
+
+import json
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import jira
+
+from jenkins_jira_integration import JiraClient, find_branch_comments, post_results_to_jira
+
+TICKET = 'CASSANDRA-1'
+COMMENTS_PATH = '/rest/api/2/issue/' + TICKET + '/comment'
+AUTHOR = 'JenkinsBot'
+
+# Fewer than find_branch_comments asks for
+SERVER_PAGE_SIZE = 7
+
+# The comments on the ticket, in order, and the first of AUTHOR's about each branch
+BRANCHES = ['trunk', 'cassandra-4.0', 'trunk', 'cassandra-4.1', 'cassandra-4.0']
+EXPECTED = {'trunk': '1002', 'cassandra-4.0': '1007', 'cassandra-4.1': '1017'}
+
+
+def main() -> None:
+    comments = []
+    for i in range(25):
+        author = AUTHOR if i % 5 in (2, 4) else 'someone'
+        body = 'Branch: ' + BRANCHES[i // 5] + ', build number: ' + str(i) + '\n' if i % 5 != 4 else 'Thanks'
+        comments.append({'id': str(1000 + i), 'author': {'name': author, 'displayName': author}, 'body': body})
+
+    requests_made: List[str] = []
+    server = ThreadingHTTPServer(('localhost', 0), fake_jira(comments, requests_made))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    jira_url = 'http://localhost:' + str(server.server_port)
+    for comment in comments:
+        comment['self'] = jira_url + COMMENTS_PATH + '/' + comment['id']
+
+    pages = (len(comments) + SERVER_PAGE_SIZE - 1) // SERVER_PAGE_SIZE
+    problems = []
+    client = JiraClient(jira.JIRA(jira_url, max_retries=0, get_server_info=False), rate=1000.0)
+    try:
+        found = dict((branch, comment.id) for branch, comment in find_branch_comments(client, TICKET, AUTHOR).items())
+        if found != EXPECTED:
+            problems.append('find_branch_comments found ' + str(found) + ', expected ' + str(EXPECTED))
+        if requests_made != ['GET ' + COMMENTS_PATH] * pages:
+            problems.append('find_branch_comments made ' + str(requests_made) + ', expected ' + str(pages) + ' pages')
+    except (jira.JIRAError, OSError, AttributeError, TypeError, ValueError, KeyError) as e:
+        problems.append('find_branch_comments raised ' + repr(e))
+
+    del requests_made[:]
+    try:
+        post_results_to_jira(client, TICKET.split('-')[1], 'cassandra-4.0', True, 'Branch: cassandra-4.0, build number: 99')
+        # python-jira reloads the comment once it's updated, but it must not be fetched before
+        update = 'PUT ' + COMMENTS_PATH + '/' + EXPECTED['cassandra-4.0']
+        if update not in requests_made or requests_made.index(update) != pages:
+            problems.append('post_results_to_jira made ' + str(requests_made) + ', expected ' + str(pages)
+                            + ' pages and then ' + update)
+        if comments[7]['body'] != 'Branch: cassandra-4.0, build number: 99':
+            problems.append('post_results_to_jira left the comment as ' + repr(comments[7]['body']))
+    except (jira.JIRAError, OSError, AttributeError, TypeError, ValueError, KeyError) as e:
+        problems.append('post_results_to_jira raised ' + repr(e))
+    server.shutdown()
+
+    for problem in problems:
+        print('FAILED: ' + problem)
+    if problems:
+        sys.exit(1)
+    print('OK: ' + str(len(comments)) + ' comments paged through, and one updated, with python-jira ' + jira.__version__)
+
+
+def fake_jira(comments: List[Dict], requests_made: List[str]) -> type:
+    class FakeJira(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            requests_made.append('GET ' + url.path)
+            comment = self.find_comment(url.path)
+            if comment is not None:
+                self.send_json(comment)
+                return
+            if url.path != COMMENTS_PATH:
+                self.send_error(404)
+                return
+            query = parse_qs(url.query)
+            start = int(query.get('startAt', ['0'])[0])
+            page_size = min(int(query.get('maxResults', [str(len(comments))])[0]), SERVER_PAGE_SIZE)
+            self.send_json({'startAt': start, 'maxResults': page_size, 'total': len(comments),
+                            'comments': comments[start:start + page_size]})
+
+        def do_PUT(self) -> None:
+            url = urlparse(self.path)
+            requests_made.append('PUT ' + url.path)
+            comment = self.find_comment(url.path)
+            if comment is None:
+                self.send_error(404)
+                return
+            comment['body'] = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['body']
+            self.send_json(comment)
+
+        def find_comment(self, path: str) -> Optional[Dict]:
+            for comment in comments:
+                if path == COMMENTS_PATH + '/' + comment['id']:
+                    return comment
+            return None
+
+        def send_json(self, body: Dict) -> None:
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json;charset=UTF-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return FakeJira
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+# Checks that the batched JIRA searches of jenkins_jira_integration.py find the same tickets for each test class as a
+# search for each on its own would, offline, with the python-jira installed, against a fake JIRA whose ~ matches words
+# the way JIRA's text search does, rather than substrings of the summary.
+
+import json
+import re
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import jira
+
+from jenkins_jira_integration import JiraClient, find_jira_tickets, search_jira_tickets
+
+SEARCH_PATH = '/rest/api/2/search'
+# What python-jira asks for to look up the ids of the fields searches return
+FIELDS_PATH = '/rest/api/2/field'
+
+# Summaries JIRA's text search and a substring check disagree about: the fake stems 'ReadRepairTests' to
+# 'readrepairtest', splits 'Hints$Dispatcher' in two, and joins the hyphenated 'Batch-LogTest'
+SUMMARIES = ['ReadRepairTests flaky on trunk', 'Hints$Dispatcher times out', 'Batch-LogTest fails with OOM',
+             'CompactionTest and StreamingTest fail together', 'CompactionTest.testMajor is flaky',
+             'Fix SSTableReaderTest on Java 17', 'ViewTest timeout']
+CLASS_NAMES = (['ReadRepairTest', 'ReadRepairTests', 'Hints$Dispatcher', 'BatchLogTest', 'CompactionTest', 'StreamingTest',
+                'SSTableReaderTest', 'ViewTest'] + ['UnticketedTest' + str(i) for i in range(60)])
+
+summary_term_re = re.compile(r'summary ~ "\*((?:[^"\\]|\\.)*)\*"')
+
+
+def main() -> None:
+    issues = [{'id': str(10000 + i), 'key': 'CASSANDRA-' + str(100 + i), 'fields': {'summary': summary}}
+              for i, summary in enumerate(SUMMARIES)]
+    searches: List[str] = []
+    server = ThreadingHTTPServer(('localhost', 0), fake_jira(issues, searches))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    jira_url = 'http://localhost:' + str(server.server_port)
+    for issue in issues:
+        issue['self'] = jira_url + '/rest/api/2/issue/' + issue['id']
+
+    problems = []
+    client = JiraClient(jira.JIRA(jira_url, max_retries=0, get_server_info=False), rate=1000.0, jobs=1)
+    try:
+        found = find_jira_tickets(client, set(CLASS_NAMES))
+        batched_searches = len(searches)
+        for class_name in CLASS_NAMES:
+            expected = [str(issue) for issue in search_jira_tickets(client, [class_name])]
+            if found.get(class_name) != expected:
+                problems.append('find_jira_tickets found ' + str(found.get(class_name)) + ' for ' + class_name
+                                + ', a search for it alone ' + str(expected))
+    except (jira.JIRAError, OSError, TypeError, ValueError, KeyError) as e:
+        problems.append('find_jira_tickets raised ' + repr(e))
+    server.shutdown()
+
+    for problem in problems:
+        print('FAILED: ' + problem)
+    if problems:
+        sys.exit(1)
+    print('OK: the tickets for ' + str(len(CLASS_NAMES)) + ' test classes found in ' + str(batched_searches)
+          + ' searches, with python-jira ' + jira.__version__)
+
+
+def words(summary: str) -> List[str]:
+    """
+    :return: the words of summary as the fake indexes them: split at anything but letters, digits and hyphens, which
+    are dropped instead, lower case, and with any plural s stemmed off
+    """
+    return [re.sub('s$', '', word.replace('-', '')) for word in re.split('[^a-z0-9-]+', summary.lower()) if word]
+
+
+def matches(jql: str, summary: str) -> bool:
+    terms = [re.sub(r'\\(.)', r'\1', term).lower() for term in summary_term_re.findall(jql)]
+    return any(term in word for term in terms for word in words(summary))
+
+
+def fake_jira(issues: List[Dict], searches: List[str]) -> type:
+    class FakeJira(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path == FIELDS_PATH:
+                self.send_json([{'id': 'summary', 'name': 'Summary'}])
+            elif url.path == SEARCH_PATH:
+                query = parse_qs(url.query)
+                self.search(query['jql'][0], int(query.get('startAt', ['0'])[0]), int(query.get('maxResults', ['50'])[0]))
+            else:
+                self.send_error(404)
+
+        def do_POST(self) -> None:
+            if urlparse(self.path).path != SEARCH_PATH:
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            self.search(body['jql'], body.get('startAt', 0), body.get('maxResults', 50))
+
+        def search(self, jql: str, start: int, max_results: int) -> None:
+            searches.append(jql)
+            found = [issue for issue in issues if matches(jql, issue['fields']['summary'])]
+            self.send_json({'startAt': start, 'maxResults': max_results, 'total': len(found),
+                            'issues': found[start:start + max_results]})
+
+        def send_json(self, body: object) -> None:
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json;charset=UTF-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return FakeJira
+
+
+if __name__ == '__main__':
+    main()
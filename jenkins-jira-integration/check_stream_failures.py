@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+# Checks the failures-only fetch of jenkins_jira_integration.py offline: stream_failures against json.loads over a test
+# report fixture cut into chunks of every awkward size, and get_failures against a fake Jenkins serving the fixture.
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Set
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from jenkins_jira_integration import FAILED_STATUSES, FAILURES_TREE, get_failures, stream_failures
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'testReport.json')
+
+# The build the fake Jenkins has a test report for; any other is a 404, as for a build that has none
+REPORT_PATH = '/job/Cassandra-trunk/1/testReport/api/json'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Checks the failures-only test report fetch against a fixture')
+    parser.add_argument('--fixture', type=str, default=DEFAULT_FIXTURE, help='Jenkins test report, filtered by the tree')
+    args = parser.parse_args()
+
+    with open(args.fixture, 'rb') as f:
+        payload = f.read()
+    expected = failures_of(json.loads(payload))
+
+    problems = []
+    for chunk_size in list(range(1, 17)) + [31, 64, 1024, len(payload)]:
+        try:
+            got = set(stream_failures(chunks(payload, chunk_size)))
+        except (OSError, ValueError, KeyError) as e:
+            problems.append('stream_failures in chunks of ' + str(chunk_size) + ' raised ' + repr(e))
+            continue
+        if got != expected:
+            problems.append('stream_failures in chunks of ' + str(chunk_size) + ' found ' + str(sorted(got)))
+
+    server = ThreadingHTTPServer(('localhost', 0), fake_jenkins(payload))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    jenkins_url = 'http://localhost:' + str(server.server_port)
+    with requests.Session() as session:
+        try:
+            got = get_failures(session, jenkins_url + REPORT_PATH)
+            if got != expected:
+                problems.append('get_failures found ' + str(sorted(got)))
+            got = get_failures(session, jenkins_url + REPORT_PATH.replace('/1/', '/2/'))
+            if got:
+                problems.append('get_failures of a build without a report found ' + str(sorted(got)))
+        except (OSError, ValueError, KeyError) as e:
+            problems.append('get_failures raised ' + repr(e))
+    server.shutdown()
+
+    for problem in problems:
+        print('FAILED: ' + problem + ', expected ' + str(sorted(expected)))
+    if problems:
+        sys.exit(1)
+    print('OK: ' + str(len(expected)) + ' failures found in ' + args.fixture)
+
+
+def failures_of(report: dict) -> Set[str]:
+    """
+    :return: the names of the failed cases in report, parsed the simple way
+    """
+    return set(case['className'] + '.' + case['name'] for suite in report['suites'] for case in suite['cases']
+               if case['status'] in FAILED_STATUSES)
+
+
+def chunks(payload: bytes, chunk_size: int) -> Iterator[bytes]:
+    # Cuts through strings, escapes and multi-byte characters alike
+    for start in range(0, len(payload), chunk_size):
+        yield payload[start:start + chunk_size]
+
+
+def fake_jenkins(payload: bytes) -> type:
+    class FakeJenkins(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path != REPORT_PATH:
+                self.send_error(404)
+                return
+            # Jenkins would send the whole report without the tree, which get_failures must never ask for
+            if parse_qs(url.query).get('tree') != [FAILURES_TREE]:
+                self.send_error(400, 'Expected tree=' + FAILURES_TREE)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json;charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    return FakeJenkins
+
+
+if __name__ == '__main__':
+    main()
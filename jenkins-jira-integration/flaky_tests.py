@@ -0,0 +1,210 @@
+#!/usr/bin/python
+
+import argparse
+import csv
+import glob
+import html
+import json
+import math
+import os
+import sqlite3
+import sys
+
+from typing import Dict, List, TextIO
+
+from jenkins_jira_integration import CACHE_VERSION, FailureIndex
+
+# Tests that fail in fewer builds than this aren't worth clustering; one failure in common says little
+DEFAULT_MIN_CLUSTER_FAILURES = 3
+
+# How alike two tests' failures must be to cluster them: the Jaccard similarity of the sets of builds they failed in
+DEFAULT_CLUSTER_SIMILARITY = 0.8
+
+# How many of the latest builds to count a test's recent failures over, to tell those still flaky from those fixed
+DEFAULT_RECENT_BUILDS = 30
+
+# int.bit_count() is only in python 3.10 and up, and much faster than counting the 1s in bin()
+popcount = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+COLUMNS = ['branch', 'test', 'builds', 'failures', 'failure_rate', 'recent_failures', 'flips', 'first_failed', 'last_failed',
+           'cluster']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Report on flaky tests from the build caches of jenkins_jira_integration.py, '
+                                                 'for all branches: how often each test failed, how often it went from '
+                                                 'passing to failing, when it first and last failed, and which tests fail '
+                                                 'together')
+    parser.add_argument('--cache-dir', type=str, default='cache', help='Directory of the build caches')
+    parser.add_argument('--csv', type=str, help='File to write the report to as CSV; - for stdout')
+    parser.add_argument('--json', type=str, help='File to write the report to as JSON; - for stdout')
+    parser.add_argument('--html', type=str, help='File to write the report to as HTML; - for stdout')
+    parser.add_argument('--recent-builds', type=int, default=DEFAULT_RECENT_BUILDS,
+                        help='How many of the latest builds to count recent failures over')
+    parser.add_argument('--min-cluster-failures', type=int, default=DEFAULT_MIN_CLUSTER_FAILURES,
+                        help='Fewest failures for a test to be clustered with others')
+    parser.add_argument('--cluster-similarity', type=float, default=DEFAULT_CLUSTER_SIMILARITY,
+                        help='Jaccard similarity of the builds two tests failed in to cluster them together')
+    args = parser.parse_args()
+
+    branches = {}
+    for path in sorted(glob.glob(os.path.join(args.cache_dir, '*.db'))):
+        branch = os.path.basename(path)[:-len('.db')]
+        store = sqlite3.connect('file:' + path + '?mode=ro', uri=True)
+        version, = store.execute('PRAGMA user_version').fetchone()
+        if version != CACHE_VERSION:
+            # Not a build cache, like jira.db, or one from another version of the script
+            continue
+        branches[branch] = analyze(store, args.recent_builds, args.min_cluster_failures, args.cluster_similarity)
+        store.close()
+
+    if not (args.csv or args.json or args.html):
+        args.csv = '-'
+    for filename, write in ((args.csv, write_csv), (args.json, write_json), (args.html, write_html)):
+        if filename == '-':
+            write(branches, sys.stdout)
+        elif filename:
+            with open(filename, 'w', encoding='utf-8', newline='') as out:
+                write(branches, out)
+
+
+def analyze(store: sqlite3.Connection, recent_builds: int = DEFAULT_RECENT_BUILDS,
+            min_cluster_failures: int = DEFAULT_MIN_CLUSTER_FAILURES,
+            cluster_similarity: float = DEFAULT_CLUSTER_SIMILARITY) -> Dict:
+    """
+    Counts and finds the failures of each test with the cache's FailureIndex. For what the index doesn't answer, we
+    work over the cache as a build x test matrix, with a row of bits for each test: bit i is set if the test failed in
+    the i'th build, oldest first. That makes going from passing to failing a handful of operations on a test's bits,
+    rather than a walk over the builds.
+    :return: the statistics for each test that failed, and the clusters of tests that fail together
+    """
+    index = FailureIndex(store)
+    builds = index.builds
+    position = {number: i for i, number in enumerate(builds)}
+
+    # Bit i is set if the i'th build follows on from the one before it, the (i - 1)'th, rather than from one we don't
+    # have; only across those do we count a test going from passing to failing
+    follows_on = 0
+    for number, previous_number in store.execute('SELECT number, previous_number FROM builds'):
+        i = position[number]
+        if i > 0 and builds[i - 1] == previous_number:
+            follows_on |= 1 << i
+
+    failed = {test_name: sum(1 << position[number] for number in failed_in)
+              for test_name, failed_in in index.failures.items()}
+
+    tests = {}
+    for test_name, bits in failed.items():
+        failures = index.fail_count(test_name)
+        tests[test_name] = {
+            'failures': failures,
+            'failure_rate': failures / index.total(),
+            'recent_failures': index.fail_count_in_last(test_name, recent_builds),
+            'flips': popcount(bits & ~(bits << 1) & follows_on),
+            'first_failed': index.first_failed(test_name),
+            'last_failed': index.last_failed(test_name),
+        }
+
+    clustered = {test_name: bits for test_name, bits in failed.items()
+                 if tests[test_name]['failures'] >= min_cluster_failures}
+    clusters = cluster(clustered, {test_name: index.failures[test_name] for test_name in clustered}, cluster_similarity)
+    for number, members in enumerate(clusters, 1):
+        for test_name in members:
+            tests[test_name]['cluster'] = number
+
+    return {'builds': len(builds), 'tests': tests, 'clusters': clusters}
+
+
+def cluster(failed: Dict[str, int], failed_in: Dict[str, List[int]], similarity: float) -> List[List[str]]:
+    """
+    Groups the tests whose failures, as bits in failed, have a Jaccard similarity of at least similarity, along with
+    those similar to them in turn. Comparing every pair of tests would be quadratic, so we only compare those sharing one
+    of the first few of their failed_in builds, rarest builds first, and failing about as often: two tests can't be
+    that similar otherwise.
+    :return: the clusters of two or more tests, largest first
+    """
+    counts = {test_name: len(numbers) for test_name, numbers in failed_in.items()}
+
+    # Count how many of these tests failed in each build, to order the builds rarest first
+    frequency: Dict[int, int] = {}
+    for numbers in failed_in.values():
+        for number in numbers:
+            frequency[number] = frequency.get(number, 0) + 1
+
+    # Union-find of the tests, with path halving
+    parents = {test_name: test_name for test_name in failed}
+
+    def find(test_name: str) -> str:
+        while parents[test_name] != test_name:
+            parents[test_name] = parents[parents[test_name]]
+            test_name = parents[test_name]
+        return test_name
+
+    # The tests so far with each build in their prefix; taking the tests least failing first keeps these in order of
+    # how often they failed, so we can stop at the first failing too rarely to be similar
+    candidates: Dict[int, List[str]] = {}
+    for test_name in sorted(failed_in, key=lambda test_name: (counts[test_name], test_name)):
+        count = counts[test_name]
+        prefix = count - math.ceil(similarity * count) + 1
+        bits = failed[test_name]
+        seen = set()
+        for number in sorted(failed_in[test_name], key=lambda number: (frequency[number], number))[:prefix]:
+            for other in reversed(candidates.setdefault(number, [])):
+                other_count = counts[other]
+                if other_count < similarity * count:
+                    break
+                if other in seen:
+                    continue
+                seen.add(other)
+                # |a & b| / |a | b| >= similarity, with |a | b| = |a| + |b| - |a & b|
+                if popcount(bits & failed[other]) * (1 + similarity) >= similarity * (count + other_count):
+                    parents[find(test_name)] = find(other)
+            candidates[number].append(test_name)
+
+    clusters: Dict[str, List[str]] = {}
+    for test_name in sorted(failed):
+        clusters.setdefault(find(test_name), []).append(test_name)
+    return sorted((members for members in clusters.values() if len(members) > 1), key=lambda members: (-len(members), members))
+
+
+def rows(branches: Dict) -> List[Dict]:
+    """
+    :return: a row for each test that failed on each branch, the flakiest first
+    """
+    result = []
+    for branch, analysis in branches.items():
+        for test_name, stats in analysis['tests'].items():
+            result.append(dict(stats, branch=branch, test=test_name, builds=analysis['builds'],
+                               failure_rate=round(stats['failure_rate'], 4), cluster=stats.get('cluster', '')))
+    return sorted(result, key=lambda row: (-row['flips'], -row['failure_rate'], row['branch'], row['test']))
+
+
+def write_csv(branches: Dict, out: TextIO) -> None:
+    writer = csv.DictWriter(out, COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows(branches))
+
+
+def write_json(branches: Dict, out: TextIO) -> None:
+    json.dump(branches, out, indent=1, sort_keys=True)
+    out.write('\n')
+
+
+def write_html(branches: Dict, out: TextIO) -> None:
+    out.write('<html>\n<head>\n<title>Flaky tests</title>\n</head>\n<body>\n<h1>Flaky tests</h1>\n')
+    out.write('<table border="1">\n<tr>' + ''.join('<th>' + column + '</th>' for column in COLUMNS) + '</tr>\n')
+    for row in rows(branches):
+        out.write('<tr>' + ''.join('<td>' + html.escape(str(row[column])) + '</td>' for column in COLUMNS) + '</tr>\n')
+    out.write('</table>\n')
+    for branch, analysis in branches.items():
+        if not analysis['clusters']:
+            continue
+        out.write('<h2>Tests failing together on ' + html.escape(branch) + '</h2>\n<ol>\n')
+        for members in analysis['clusters']:
+            out.write('<li>' + ', '.join(html.escape(test_name) for test_name in members) + '</li>\n')
+        out.write('</ol>\n')
+    out.write('</body>\n</html>\n')
+
+
+if __name__ == '__main__':
+    main()
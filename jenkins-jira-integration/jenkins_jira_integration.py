@@ -1,17 +1,29 @@
 #!/usr/bin/python
 
 import argparse
+import bisect
+import codecs
 import json
 import os
+import queue
+import random
 import re
+import sqlite3
 import sys
+import threading
+import time
 
-from typing import Dict, Set
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
 from jenkins import Jenkins
-from jira import JIRA
+from jira import JIRA, JIRAError
+from jira.resources import Comment
 
 import jenkins
+import requests
 
+T = TypeVar('T')
 # Used in logging method to flip logging on and off
 VERBOSE = False
 
@@ -21,6 +33,67 @@ NUMBER = 'number'
 PREVIOUS_NUMBER = 'previous_number'
 UNKNOWN = 'unknown'
 
+# JIRA searches for tickets about failing tests: the query for one class name, and limits on how many class names, and
+# how long a query, we OR together into a single search
+JIRA_QUERY = 'project = CASSANDRA and resolution = unresolved and '
+JIRA_SUMMARY_TERM = 'summary ~ "*{}*"'
+JIRA_TERMS_PER_SEARCH = 50
+JIRA_MAX_QUERY_LENGTH = 4000
+
+# Seconds we trust what JIRA told us about the tickets for a class name, and trust it that there are none, which is more
+# likely to change as new flaky tests get tickets
+DEFAULT_JIRA_TTL = 24 * 60 * 60
+DEFAULT_JIRA_NEGATIVE_TTL = 60 * 60
+
+# Bounds on how hard we lean on JIRA, which rate-limits us: how many requests a second we make on average, in bursts of
+# up to how many, how many at once, and how many times we try each
+DEFAULT_JIRA_RATE = 2.0
+JIRA_BURST = 5
+DEFAULT_JIRA_JOBS = 4
+JIRA_ATTEMPTS = 5
+
+# How many comments to fetch from a JIRA ticket at a time, and issues from a search; JIRA may return fewer than asked
+# for, so paging carries on until the total it reports
+JIRA_COMMENTS_PAGE_SIZE = 100
+JIRA_SEARCH_PAGE_SIZE = 100
+
+# The version of the JIRA lookup cache's schema, kept in its user_version
+JIRA_CACHE_VERSION = 1
+
+# The version of the cache's schema, kept in its user_version
+CACHE_VERSION = 1
+
+# Seconds to wait for another job writing to the same cache
+CACHE_TIMEOUT = 300
+
+# Bounds on how hard we lean on Jenkins when backfilling the cache: how many builds we fetch at once, how many times we
+# try each request, and the base of the exponential backoff between tries, in seconds
+DEFAULT_FETCH_JOBS = 8
+FETCH_ATTEMPTS = 5
+FETCH_BACKOFF = 1.0
+
+# Seconds to wait on any one Jenkins request before giving up on it
+JENKINS_TIMEOUT = 300
+
+# Test case statuses we count as failures. We treat failures and regressions the same as we're going to rely on our
+# history cache to provide per-test failure context
+FAILED_STATUSES = ('FAILED', 'REGRESSION')
+
+# Jenkins tree= filters for just the fields the cache needs, rather than everything at depth=5: test reports run to tens
+# of MB a build with every case's stdout, stderr and stack trace, when all we keep is the names of the failures
+ALL_BUILDS_TREE = 'allBuilds[number]'
+BUILDS_TREE = 'builds[number,result]'
+PREVIOUS_BUILD_TREE = 'previousBuild[number]'
+FAILURES_TREE = 'suites[cases[className,name,status]]'
+
+# How much of a test report to read from Jenkins at a time, and how deep the cases are nested in it:
+# {"suites": [{"cases": [{...}, ...]}, ...]}
+FETCH_CHUNK_SIZE = 65536
+CASE_DEPTH = 5
+
+# Seconds between polls of Jenkins for newly completed builds, when running as a daemon
+DEFAULT_POLL_INTERVAL = 60
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description='Parse Jenkins build output and optionally update JIRA tickets with results for a single branch')
@@ -35,46 +108,166 @@ def main() -> None:
     required.add_argument('--jirauser', type=str, required=True, help='JIRA username')
     required.add_argument('--jirapass', type=str, required=True, help='JIRA password')
     required.add_argument('--branch', metavar='b', type=str, required=True,
-                          help='Branch Versions to pull Jenkins results for')
+                          help='Branch Versions to pull Jenkins results for; with --daemon, a comma separated list')
     required.add_argument('--buildnum', metavar='n', type=str, help='Build number to process for CI status')
 
     optional.add_argument('--verbose', action='store_true', default='False', help='Verbose logging')
     optional.add_argument('--auto', action='store_true', default='False', help='Update Jira tickets with CI information automatically')
+    optional.add_argument('--jobs', type=int, default=DEFAULT_FETCH_JOBS,
+                          help='Number of builds to fetch from Jenkins at once when filling the cache')
+    optional.add_argument('--keep-discarded', action='store_true', default=False,
+                          help='Keep builds Jenkins has discarded in the cache, rather than pruning them')
+    optional.add_argument('--jira-ttl', type=int, default=DEFAULT_JIRA_TTL,
+                          help='Seconds to reuse the JIRA tickets found for a test class before searching again')
+    optional.add_argument('--jira-negative-ttl', type=int, default=DEFAULT_JIRA_NEGATIVE_TTL,
+                          help='Seconds to reuse finding no JIRA tickets for a test class before searching again')
+    optional.add_argument('--refresh-jira', action='store_true', default=False,
+                          help='Search JIRA for every test class, ignoring the tickets cached from earlier runs')
+    optional.add_argument('--jira-rate', type=float, default=DEFAULT_JIRA_RATE,
+                          help='Requests a second to make to JIRA, on average')
+    optional.add_argument('--jira-jobs', type=int, default=DEFAULT_JIRA_JOBS,
+                          help='Number of searches to run against JIRA at once')
+    optional.add_argument('--daemon', action='store_true', default=False,
+                          help='Keep running, processing each build of the branches as it completes, instead of --buildnum')
+    optional.add_argument('--poll-interval', type=int, default=DEFAULT_POLL_INTERVAL,
+                          help='Seconds between polls of Jenkins for completed builds, with --daemon')
 
     args = parser.parse_args()
+    if not args.daemon and args.buildnum is None:
+        parser.error('--buildnum is required unless running with --daemon')
     global VERBOSE
     if args.verbose:
         VERBOSE = True
 
-    # first we build the path to and confirm existence of the buildnum requested
-    jenkins_url = 'https://ci-cassandra.apache.org'
-    log('Connecting to jenkins server...')
-    server = Jenkins(jenkins_url, username=args.jenuser, password=args.jenpass)
+    reporter = Reporter(args)
+    if args.daemon:
+        run_daemon(reporter, args.branch.split(','), args.poll_interval)
+    elif not reporter.process_build(args.branch, args.buildnum):
+        sys.exit(-1)
 
-    # We store a per-branch JSON file with cached data of test number, previous number, and all failures so we don't
-    # have to query JIRA for each build's data every time we run the script
-    ci_cache = build_local_cache(server, args.branch, args.buildnum)
 
-    log('Retrieving build. Branch: ' + args.branch + '. Build number: ' + args.buildnum)
-    build_data = retrieve_build_details(server, args.branch, args.buildnum)
+class Reporter:
+    def __init__(self, args: argparse.Namespace) -> None:
+        """
+        Holds what processing builds needs from one build to the next: the connections to Jenkins and JIRA, and each
+        branch's cache and its FailureIndex, so that a daemon keeps them warm rather than starting cold every build.
+        :param args: the command line options
+        """
+        self.args = args
 
-    # jira_results represents the data we're going to post to the final JIRA ticket about this CI run and test histories
-    jira_results = '[CI Results]\n'
-    jira_results += build_data.string_detailed()
+        # first we build the path to and confirm existence of the buildnum requested
+        self.jenkins_url = 'https://ci-cassandra.apache.org'
+        log('Connecting to jenkins server...')
+        self.server = Jenkins(self.jenkins_url, username=args.jenuser, password=args.jenpass, timeout=JENKINS_TIMEOUT)
 
-    # Add a space between CI meta and test details for aesthetics
-    jira_results += '\n'
+        # The cache is filled over plain HTTP, so we can filter what Jenkins sends and stream it; share the connections
+        # between the fetching threads
+        self.session = requests.Session()
+        self.session.auth = (args.jenuser, args.jenpass)
+        self.session.mount(self.jenkins_url, requests.adapters.HTTPAdapter(pool_maxsize=args.jobs))
 
-    jira = JIRA('https://issues.apache.org/jira', basic_auth=(args.jirauser, args.jirapass))
+        # JiraClient does the retrying, at the rate it allows; python-jira's own retries would multiply its attempts
+        self.jira = JiraClient(JIRA('https://issues.apache.org/jira', basic_auth=(args.jirauser, args.jirapass),
+                                    max_retries=0),
+                               args.jira_rate, args.jira_jobs)
 
-    # Putting this in a table goes a long way towards making it parseable
-    jira_results += '||Test|Failures|JIRA||\n'
-    for test_name in build_data.test_failures:
-        failures, total, jiralink = get_test_failure_details(jira, test_name, ci_cache)
-        jira_results += ('|' + test_name + '|' + str(failures) + ' of ' + str(total) + '|' + jiralink + '\n')
+        # Opened on first use, by the thread processing builds
+        self.caches: Dict[str, Tuple[sqlite3.Connection, FailureIndex]] = {}
 
-    # Next, we want to query JIRA for the cassandra ticket in question and see if we've given it an update yet on build status; protect against spamming
-    post_results_to_jira(jira, build_data.JIRA, args.branch, args.auto, jira_results)
+    def process_build(self, branch: str, buildnum: str) -> bool:
+        """
+        Reports the results of a build to its JIRA ticket.
+        :return: whether there was a ticket to report them to
+        """
+        # We store a per-branch database with cached data of test number, previous number, and all failures so we don't
+        # have to query JIRA for each build's data every time we run the script
+        if branch in self.caches:
+            ci_cache, failure_index = self.caches[branch]
+            # Other jobs sharing the cache may have added builds since we last looked
+            failure_index.refresh(ci_cache)
+        else:
+            ci_cache = open_cache(branch)
+            failure_index = FailureIndex(ci_cache)
+            self.caches[branch] = (ci_cache, failure_index)
+        added, pruned = build_local_cache(ci_cache, self.session, self.jenkins_url, branch, buildnum, self.args.jobs,
+                                          not self.args.keep_discarded)
+        for newcache_data in added:
+            failure_index.add(newcache_data)
+        failure_index.remove(pruned)
+
+        log('Retrieving build. Branch: ' + branch + '. Build number: ' + buildnum)
+        build_data = retrieve_build_details(self.server, branch, buildnum)
+        if build_data is None:
+            return False
+
+        # jira_results represents the data we're going to post to the final JIRA ticket about this CI run and test histories
+        jira_results = '[CI Results]\n'
+        jira_results += build_data.string_detailed()
+
+        # Add a space between CI meta and test details for aesthetics
+        jira_results += '\n'
+
+        # Many failing tests share a class name, which is all we search JIRA for, so look them all up together, and only
+        # those we haven't recently
+        jira_tickets = find_cached_jira_tickets(self.jira,
+                                                set(jira_class_name(test_name) for test_name in build_data.test_failures),
+                                                self.args.jira_ttl, self.args.jira_negative_ttl, self.args.refresh_jira)
+
+        # Putting this in a table goes a long way towards making it parseable
+        jira_results += '||Test|Failures|JIRA||\n'
+        for test_name in build_data.test_failures:
+            failures, total, jiralink = get_test_failure_details(test_name, failure_index, jira_tickets)
+            jira_results += ('|' + test_name + '|' + str(failures) + ' of ' + str(total) + '|' + jiralink + '\n')
+
+        # Next, we want to query JIRA for the cassandra ticket in question and see if we've given it an update yet on build status; protect against spamming
+        post_results_to_jira(self.jira, build_data.JIRA, branch, self.args.auto, jira_results)
+        return True
+
+
+def run_daemon(reporter: Reporter, branches: List[str], poll_interval: int) -> None:
+    """
+    Polls Jenkins for builds of branches completed since we started, queueing each to be processed in turn by a worker
+    thread, so that polling carries on while it works. Runs until interrupted.
+    """
+    work: queue.Queue = queue.Queue()
+    threading.Thread(target=work_through, args=(reporter, work), daemon=True).start()
+
+    # The builds of each branch that have completed, whether before we started or since, and so been queued
+    completed: Dict[str, Set[int]] = {}
+    print('Polling Jenkins for completed builds of: ' + ', '.join(branches))
+    while True:
+        for branch in branches:
+            try:
+                job = with_retries(get_json, reporter.session, reporter.jenkins_url + '/job/Cassandra-' + branch + '/api/json',
+                                   BUILDS_TREE)
+            except (jenkins.JenkinsException, OSError) as e:
+                print('Failed to poll Jenkins for branch: ' + branch + '. Exception received: ' + str(e))
+                continue
+            if job is None or not job['builds']:
+                continue
+
+            # Builds can finish out of order, so a build is only queued once it has a result, however many later ones
+            # finished first; until then it's looked for again on the next poll
+            finished = set(build[NUMBER] for build in job['builds'] if build['result'] is not None)
+            if branch in completed:
+                for buildnum in sorted(finished - completed[branch]):
+                    log('Queueing build_number ' + str(buildnum) + ' on branch [' + branch + ']')
+                    work.put((branch, str(buildnum)))
+            # Only the builds Jenkins still lists can turn up again
+            oldest = min(build[NUMBER] for build in job['builds'])
+            completed[branch] = set(number for number in completed.get(branch, set()) | finished if number >= oldest)
+        time.sleep(poll_interval)
+
+
+def work_through(reporter: Reporter, work: queue.Queue) -> None:
+    while True:
+        branch, buildnum = work.get()
+        try:
+            reporter.process_build(branch, buildnum)
+        except (Exception, SystemExit) as e:
+            # Whatever goes wrong with one build, including what would end a run for a single build, shouldn't stop us
+            # processing the next
+            print('ERROR! Failed to process build_number: ' + buildnum + ' on branch [' + branch + ']. Exception received: ' + repr(e))
 
 
 class BuildData:
@@ -141,8 +334,7 @@ class BuildData:
         suites = tests['suites']
         for suite in suites:
             for case in suite['cases']:
-                # We treat failures and regressions the same as we're going to rely on our history cache to provide per-test failure context
-                if (case['status'] == 'FAILED') or case['status'] == 'REGRESSION':
+                if case['status'] in FAILED_STATUSES:
                     self.test_failures.add(case['className'] + '.' + case['name'])
 
     def string_detailed(self) -> str:
@@ -168,7 +360,7 @@ class BuildData:
         return result
 
 
-def retrieve_build_details(server: jenkins, branch: str, build_num: int) -> BuildData:
+def retrieve_build_details(server: jenkins, branch: str, build_num: int) -> Optional[BuildData]:
     result = None
     found_build = False
 
@@ -179,14 +371,74 @@ def retrieve_build_details(server: jenkins, branch: str, build_num: int) -> Buil
     if result.JIRA == UNKNOWN:
         print('No related CASSANDRA-NNNNN Jira found for build: ' + str(result.number) + '. Commit Message: ' + result.commit_msg)
         print('Exiting processing; nothing to be done for this build if we can\'t determine the JIRA ticket it\'s associated with.')
-        sys.exit(-1)
+        return None
 
     log('Parsed JIRA number: ' + result.JIRA + ' for build: ' + str(result.number))
     assert result is not None
     return result
 
 
-def post_results_to_jira(jira: JIRA, ticket_number: str, branch: str, post_to_jira: bool, ci_results: str) -> None:
+class JiraClient:
+    def __init__(self, jira: JIRA, rate: float = DEFAULT_JIRA_RATE, jobs: int = DEFAULT_JIRA_JOBS) -> None:
+        """
+        Wraps a JIRA instance so that its requests are made no faster than rate a second on average, from a bucket of
+        up to JIRA_BURST tokens, and are retried with backoff when JIRA says it's too busy (429) or fails (5xx).
+        Calling any JIRA method on this does so; call() does the same for the methods of what they return. Each call
+        takes one token, so methods that make several requests, like searches for all results, are paged by callers.
+        :param jobs: how many requests callers should make at once
+        """
+        self.jira = jira
+        self.rate = rate
+        self.jobs = jobs
+        self.tokens = float(JIRA_BURST)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Callable:
+        function = getattr(self.jira, name)
+        return lambda *args, **kwargs: self.call(function, *args, **kwargs)
+
+    def call(self, function: Callable[..., T], *args, **kwargs) -> T:
+        attempt = 1
+        while True:
+            self.take_token()
+            try:
+                return function(*args, **kwargs)
+            except (JIRAError, OSError) as e:
+                status = getattr(e, 'status_code', None)
+                if attempt == JIRA_ATTEMPTS or (status is not None and status != 429 and status < 500):
+                    raise
+                delay = retry_after(e) or FETCH_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+                log('   JIRA request failed with: ' + str(e) + '. Retrying in ' + format(delay, '.1f') + 's')
+                time.sleep(delay)
+                attempt += 1
+
+    def take_token(self) -> None:
+        """
+        Waits for a token from the bucket, which refills at rate tokens a second.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(JIRA_BURST, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after(e: Exception) -> Optional[float]:
+    """
+    :return: the seconds JIRA asked us to wait before trying again, if it did
+    """
+    response = getattr(e, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    return float(value) if value and value.isdigit() else None
+
+
+def post_results_to_jira(jira: JiraClient, ticket_number: str, branch: str, post_to_jira: bool, ci_results: str) -> None:
     """
     :param jira: Connected and authenticated JIRA instance
     :param ticket_number: as named
@@ -196,11 +448,6 @@ def post_results_to_jira(jira: JIRA, ticket_number: str, branch: str, post_to_ji
     :param ci_results: str to post to jira ticket
     :return:
     """
-    log('Attempting to connect to jira and get issue: CASSANDRA-' + ticket_number)
-    issue = jira.issue('CASSANDRA-' + ticket_number)
-    log('Checking comments on ' + str(issue))
-    comments = issue.fields.comment.comments
-
     # There's a little nuance here. We have two motions we could potentially need to go through
     #   1) We don't have anything on this ticket for this branch by JenkinsBot, so we want to add
     #   2) We already have an entry on this ticket for this branch by JenkinsBot, so we want to update
@@ -208,20 +455,17 @@ def post_results_to_jira(jira: JIRA, ticket_number: str, branch: str, post_to_ji
     # TODO put the correct account name here
     my_name = 'JenkinsBot'
 
-    # Walk the comments for any we authored with the branch name of what we're processing. If we find it, update it
-    for comment in comments:
-        if str(comment.author) == my_name:
-            # We know we wrote it; now we need to determine if this comment was for the branch we're currently
-            # processing to determine if we need to update it
-            comment_text = jira.comment('CASSANDRA-' + ticket_number, comment)
-            if 'Branch: ' + branch in comment_text.body:
-                # This is an update
-                if post_to_jira is True:
-                    comment.update(body=ci_results)
-                else:
-                    print('[UPDATE] comment to manually post to Jira for CASSANDRA-' + ticket_number)
-                    print(ci_results)
-                return
+    # Find any comments we authored with the branch name of what we're processing. If we find it, update it
+    log('Checking comments on CASSANDRA-' + ticket_number)
+    comment = find_branch_comments(jira, 'CASSANDRA-' + ticket_number, my_name).get(branch)
+    if comment is not None:
+        # This is an update, of the comment as it was fetched, rather than fetching it again
+        if post_to_jira is True:
+            jira.call(comment.update, body=ci_results)
+        else:
+            print('[UPDATE] comment to manually post to Jira for CASSANDRA-' + ticket_number)
+            print(ci_results)
+        return
 
     if post_to_jira is True:
         print('Posting to JIRA from the bot is not yet tested and enabled.')
@@ -233,78 +477,405 @@ def post_results_to_jira(jira: JIRA, ticket_number: str, branch: str, post_to_ji
         print(ci_results)
 
 
-def build_local_cache(server: jenkins, branch: str, buildnum: str) -> Dict:
+def find_branch_comments(jira: JiraClient, ticket: str, author: str) -> Dict[str, Comment]:
+    """
+    Pages through the comments on ticket, just the comments rather than the whole issue, for those author wrote about
+    a branch's CI results, which start with the 'Branch: ' line of BuildData.string_detailed().
+    :return: author's first comment about each branch, ready to update
+    """
+    comments: Dict[str, Comment] = {}
+    start = 0
+    while True:
+        page, total = jira.call(comments_page, jira.jira, ticket, start)
+        for comment in page:
+            if comment.author.displayName == author:
+                matches = re.search(r'Branch: ([^,\s]+)', comment.body)
+                if matches is not None:
+                    comments.setdefault(matches.group(1), comment)
+        start += len(page)
+        if not page or start >= total:
+            return comments
+
+
+def comments_page(jira: JIRA, ticket: str, start: int) -> Tuple[List[Comment], int]:
+    """
+    Fetches one page of the comments on ticket. python-jira's comments() only pages from 3.10 on, and before then fetches
+    them all in one request, which JIRA cuts short on tickets with many comments, so this asks for the page itself.
+    :return: the comments from start on, and how many there are on ticket
+    """
+    page = jira._get_json('issue/' + ticket + '/comment', params={'startAt': start, 'maxResults': JIRA_COMMENTS_PAGE_SIZE})
+    return [Comment(jira._options, jira._session, raw) for raw in page['comments']], page['total']
+
+
+def build_local_cache(store: sqlite3.Connection, session: requests.Session, jenkins_url: str, branch: str, buildnum: str,
+                      jobs: int = DEFAULT_FETCH_JOBS, prune: bool = True) -> Tuple[List[Dict], Set[int]]:
+    """
+    For the input build back as far as we have history, we want to cache the following, in cache/<branch>.db:
+        builds:             number of each build, and the previous_number of the build before it
+        failures:           (test_name, number) of each test failure seen in each build
+
+    Rather than walking the previous build pointers one round trip at a time, we ask Jenkins once for every build it
+    still has for the job and fetch the ones missing from the cache concurrently, up to jobs at a time. Each is saved
+    as soon as we have it, so an interrupted run keeps what it got. If prune, builds Jenkins has discarded are dropped
+    from the cache, so it only grows as far as Jenkins' own history.
+    :param store: the cache, from open_cache
+    :return: the cache entries added, and the numbers of the builds pruned
     """
-    For the input build back as far as we have history, we want to cache the following (k/v):
-        NUMBER:             str number of this build
-        PREVIOUS_NUMBER     str build number of the previous build to walk to when walking the cache
-        failures:           set of test failures seen for this build (note: sets aren't serializable in JSON so we cast to list)
+    cached = set(number for number, in store.execute('SELECT number FROM builds'))
+    log('Loaded ' + str(len(cached)) + ' builds from cache')
 
-        We use the build number and previous number as strings since they're going to get case to that in the JSON
-        ser/deser anyway, so best not to mix.
-    :return: testnu->
+    log('Listing builds of Cassandra-' + branch + ' up to build_number ' + buildnum)
+    job_info = with_retries(get_json, session, jenkins_url + '/job/Cassandra-' + branch + '/api/json', ALL_BUILDS_TREE)
+    if job_info is None:
+        print('No Jenkins job found for branch: ' + branch + '. Exiting.')
+        sys.exit(-1)
+    available = set(build[NUMBER] for build in job_info['allBuilds'])
+    missing = [str(number) for number in sorted(available, reverse=True)
+               if number <= int(buildnum) and number not in cached]
+    if missing:
+        print('   Did not find ' + str(len(missing)) + ' builds in the cache. Populating...')
+
+    added = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(fetch_cache_entry, session, jenkins_url, branch, number): number for number in missing}
+        for future in as_completed(futures):
+            number = futures[future]
+            try:
+                newcache_data = future.result()
+            except (jenkins.JenkinsException, OSError, ValueError, KeyError) as e:
+                # Leave it out, whether Jenkins wouldn't give it to us or gave us a test report we can't read; not being
+                # in the cache, we'll try it again next run
+                print('   Failed to fetch build_number: ' + number + ' from Jenkins; skipping it. Exception received: ' + str(e))
+                continue
+            if newcache_data is None:
+                log('   Build_number: ' + number + ' was discarded by Jenkins before we got to it. Skipping.')
+                continue
+
+            log('   Got data for ' + str(newcache_data[NUMBER]) + '. Caching with previous build pointer: ' + str(newcache_data[PREVIOUS_NUMBER]))
+            log('   build number: ' + str(newcache_data[NUMBER]) + ' with failure count: ' + str(len(newcache_data['failures'])))
+            save_build(store, newcache_data)
+            added.append(newcache_data)
+
+    # An empty list is more likely Jenkins having a bad day than having discarded every build
+    discarded = cached - available
+    if not prune or not available:
+        return added, set()
+    if discarded:
+        log('   Pruning ' + str(len(discarded)) + ' builds Jenkins has discarded from the cache')
+        with store:
+            store.executemany('DELETE FROM failures WHERE number = ?', ((number,) for number in discarded))
+            store.executemany('DELETE FROM builds WHERE number = ?', ((number,) for number in discarded))
+    return added, discarded
+
+
+def open_cache(branch: str) -> sqlite3.Connection:
+    """
+    Opens the cache for branch, creating it if need be, and importing the JSON file we used to keep before. The cache
+    is in WAL mode, so jobs for the same branch can read it while another writes to it.
     """
     if not os.path.isdir('cache'):
         os.mkdir('cache')
 
-    cached_data = {}
-    json_file = 'cache/' + branch
-    if os.path.exists(json_file):
-        with open(json_file, 'r', encoding='utf-8') as infile:
-            cached_data = json.load(infile)
-        for build in cached_data:
-            log('Loaded build: [' + str(build) + '] from cache')
-
-    while buildnum != NO_PREVIOUS_BUILD:
-        log('Processing cache for build_number ' + buildnum + ' on branch [' + branch + ']')
-        if buildnum in cached_data:
-            build_data = cached_data[buildnum]
-            log('   Already found data for ' + buildnum + ' cached locally. Continuing to ' + str(build_data[PREVIOUS_NUMBER]))
-            buildnum = str(build_data[PREVIOUS_NUMBER])
-        else:
-            print('   Did not find build_number: ' + buildnum + ' in the json cache. Populating...')
-            # Pull the data from the Jenkins server as we don't have it in our cache
-            build_data = BuildData(server, branch, buildnum)
+    store = sqlite3.connect('cache/' + branch + '.db', timeout=CACHE_TIMEOUT, isolation_level=None)
+    store.execute('PRAGMA journal_mode = WAL')
+    store.execute('BEGIN IMMEDIATE')
+    try:
+        version, = store.execute('PRAGMA user_version').fetchone()
+        if version != CACHE_VERSION:
+            store.execute('DROP TABLE IF EXISTS builds')
+            store.execute('DROP TABLE IF EXISTS failures')
+            store.execute('CREATE TABLE builds (number INTEGER PRIMARY KEY, previous_number INTEGER)')
+            store.execute('CREATE TABLE failures (test_name TEXT, number INTEGER, PRIMARY KEY (test_name, number))'
+                          ' WITHOUT ROWID')
+            store.execute('CREATE INDEX failures_by_build ON failures (number)')
+            store.execute('PRAGMA user_version = %d' % CACHE_VERSION)
+
+        # Checked within the transaction, so usually only one job imports it
+        json_file = 'cache/' + branch
+        imported = os.path.exists(json_file)
+        if imported:
+            log('Importing JSON cache ' + json_file)
+            with open(json_file, 'r', encoding='utf-8') as infile:
+                for build_data in json.load(infile).values():
+                    insert_build(store, build_data)
+        store.execute('COMMIT')
+    except BaseException:
+        store.execute('ROLLBACK')
+        raise
+    store.isolation_level = ''
+
+    # Only moved aside once its builds are safely in the cache, so if we don't get that far it's imported next run. A
+    # job that got in between the commit and this imports it again, which the cache ignores
+    if imported:
+        try:
+            os.replace(json_file, json_file + '.imported')
+        except FileNotFoundError:
+            pass
+    return store
+
+
+def save_build(store: sqlite3.Connection, build_data: Dict) -> None:
+    """
+    Adds a cache entry to the cache in a transaction of its own.
+    """
+    with store:
+        insert_build(store, build_data)
 
-            # The data in our JSON cache is a pretty simple subset of what we have in BuildData for a full CI report
-            newcache_data = {}
-            newcache_data[NUMBER] = build_data.number
-            newcache_data[PREVIOUS_NUMBER] = build_data.previous_number
-            # Can't serialize sets to JSON
-            newcache_data['failures'] = list(build_data.test_failures)
 
-            log('   Got data for ' + str(newcache_data[NUMBER]) + '. Caching and setting previous build pointer to: ' + str(newcache_data[PREVIOUS_NUMBER]))
-            if 'failures' in newcache_data:
-                log('   build number: ' + str(newcache_data[NUMBER]) + ' with failure count: ' + str(len(newcache_data['failures'])))
+def insert_build(store: sqlite3.Connection, build_data: Dict) -> None:
+    """
+    Adds a cache entry to the cache, unless another job for the branch beat us to it.
+    """
+    number = int(build_data[NUMBER])
+    store.execute('INSERT OR IGNORE INTO builds VALUES (?, ?)', (number, int(build_data[PREVIOUS_NUMBER])))
+    store.executemany('INSERT OR IGNORE INTO failures VALUES (?, ?)',
+                      ((test_name, number) for test_name in build_data['failures']))
 
-            # JSON comes back out as a string; need to follow suit here so the cache is all the same data type
-            cached_data[str(build_data.number)] = newcache_data
 
-            # cast to str should be redundant but it's coming out as an int. Not worth arguing with it.
-            buildnum = str(newcache_data[PREVIOUS_NUMBER])
+def fetch_cache_entry(session: requests.Session, jenkins_url: str, branch: str, buildnum: str) -> Optional[Dict]:
+    """
+    Pulls the data for a build we don't have in our cache from the Jenkins server. Runs on the cache filler's pool.
+    Unlike BuildData, we only ask for what the cache keeps, and keep only the failures out of the test report as it
+    streams in.
+    :return: the cache entry for the build, or None if Jenkins no longer has it
+    """
+    log('Processing cache for build_number ' + buildnum + ' on branch [' + branch + ']')
+    build_url = jenkins_url + '/job/Cassandra-' + branch + '/' + buildnum + '/'
+    build = with_retries(get_json, session, build_url + 'api/json', PREVIOUS_BUILD_TREE)
+    if build is None:
+        return None
+    failures = with_retries(get_failures, session, build_url + 'testReport/api/json')
+
+    # The data in our cache is a pretty simple subset of what we have in BuildData for a full CI report
+    newcache_data = {}
+    newcache_data[NUMBER] = buildnum
+    if build['previousBuild'] is None:
+        newcache_data[PREVIOUS_NUMBER] = NO_PREVIOUS_BUILD
+    else:
+        newcache_data[PREVIOUS_NUMBER] = build['previousBuild'][NUMBER]
+    # Can't serialize sets to JSON
+    newcache_data['failures'] = list(failures)
+    return newcache_data
 
-    log('   Hit limit of builds. Saving JSON.')
-    with open(json_file, 'w', encoding='utf-8') as outfile:
-        log('Updating the cache with recently queried results')
-        json.dump(cached_data, outfile)
 
-    return cached_data
+def get_json(session: requests.Session, url: str, tree: str) -> Optional[Dict]:
+    """
+    :return: the JSON at url, filtered by Jenkins to tree, or None if there's nothing there
+    """
+    with session.get(url, params={'tree': tree}, timeout=JENKINS_TIMEOUT) as response:
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
 
 
-def get_test_failure_details(jira: JIRA, test_name: str, data: Dict) -> tuple[int, int, str]:
+def get_failures(session: requests.Session, url: str) -> Set[str]:
     """
-    :param data: Dict representing JSON cached data
-    :return: failures, total, test failure JIRA url if found, link to test board if not
+    :return: the names of the failed cases in the test report at url, which bad builds may not have
     """
-    fail_count = 0
-    total = 0
+    with session.get(url, params={'tree': FAILURES_TREE}, stream=True, timeout=JENKINS_TIMEOUT) as response:
+        if response.status_code == 404:
+            return set()
+        response.raise_for_status()
+        return set(stream_failures(response.iter_content(FETCH_CHUNK_SIZE)))
+
+
+# The tokens that matter when following the nesting of JSON: whole objects with no others in them, like the cases, whole
+# strings, which may contain any of the others, a quote starting a string not yet all read, and brackets
+json_token_re = re.compile(r'\{[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*\}|"[^"\\]*(?:\\.[^"\\]*)*"|"|[{}\[\]]')
 
-    for build in data:
-        build_data = data[build]
-        total += 1
-        if test_name in build_data['failures']:
-            fail_count += 1
 
+def stream_failures(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Parses a test report filtered by FAILURES_TREE as it arrives in chunks, without ever holding more of it than a
+    chunk and a case. We only follow the nesting of the JSON to find where each case starts and ends, and leave the
+    parsing of the failed cases themselves to json.
+    :return: the names of the failed cases
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    # Where to pick up the scan of buffer, how deeply nested we are there, and where the case we're in started, if any
+    scan_from = 0
+    depth = 0
+    case_start = -1
+    for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        resume = len(buffer)
+        for match in json_token_re.finditer(buffer, scan_from):
+            token = match.group()
+            if token == '"':
+                # A string cut off by the end of the chunk; scan it again with the next one
+                resume = match.start()
+                break
+            if len(token) > 1:
+                # A whole string, or a whole case if it's at the depth of the cases; those cut off by the end of the
+                # chunk are instead followed token by token below
+                if depth == CASE_DEPTH - 1 and token[0] == '{':
+                    yield from failure(token)
+            elif token == '{' or token == '[':
+                depth += 1
+                if depth == CASE_DEPTH and token == '{':
+                    case_start = match.start()
+            elif token == '}' or token == ']':
+                if depth == CASE_DEPTH and case_start >= 0:
+                    yield from failure(buffer[case_start:match.end()])
+                    case_start = -1
+                depth -= 1
+
+        # Drop what we're done with, keeping any case we're in the middle of
+        if case_start >= 0:
+            buffer = buffer[case_start:]
+            scan_from = resume - case_start
+            case_start = 0
+        else:
+            buffer = buffer[resume:]
+            scan_from = 0
+
+    if depth != 0 or buffer.strip():
+        raise OSError('Test report ended before it was complete')
+
+
+def failure(case_json: str) -> Iterator[str]:
+    """
+    :return: the name of the case in case_json if it failed; most don't, so we only parse those that might have
+    """
+    if any('"' + status + '"' in case_json for status in FAILED_STATUSES):
+        case = json.loads(case_json)
+        if case.get('status') in FAILED_STATUSES:
+            yield case['className'] + '.' + case['name']
+
+
+def with_retries(function: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Calls function with the given arguments, retrying with exponential backoff and jitter on the errors a busy or
+    flaky Jenkins gives us: timeouts, dropped connections, 429 and 5xx responses. Anything else, like a build that
+    doesn't exist or credentials Jenkins won't take, is raised straight away.
+    """
+    attempt = 1
+    while True:
+        try:
+            return function(*args, **kwargs)
+        except (jenkins.JenkinsException, OSError) as e:
+            if attempt == FETCH_ATTEMPTS or not retryable(e):
+                raise
+            delay = FETCH_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+            log('   Request failed with: ' + str(e) + '. Retrying in ' + format(delay, '.1f') + 's')
+            time.sleep(delay)
+            attempt += 1
+
+
+def retryable(error: Exception) -> bool:
+    """
+    :return: whether error is worth trying again: a timeout, a dropped connection, or a 429 or 5xx response
+    """
+    if isinstance(error, jenkins.TimeoutException):
+        return True
+    if isinstance(error, jenkins.JenkinsException):
+        # python-jenkins turns the HTTP errors it gets into its own, leaving the original as the context
+        error = error.__context__
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, OSError)
+
+
+class FailureIndex:
+    def __init__(self, store: sqlite3.Connection) -> None:
+        """
+        An inverted index of the cache: for each test that failed, the numbers of the builds it failed in. We build it
+        once, so that looking up a test's history doesn't mean going back to the cache for it.
+        :param store: the cache
+        """
+        # All the cached build numbers, and each failed test's, in ascending order
+        self.builds: List[int] = [number for number, in store.execute('SELECT number FROM builds ORDER BY number')]
+        self.failures: Dict[str, List[int]] = {}
+        for test_name, number in store.execute('SELECT test_name, number FROM failures ORDER BY test_name, number'):
+            self.failures.setdefault(test_name, []).append(number)
+
+    def add(self, build_data: Dict) -> None:
+        """
+        Adds a build newly added to the cache.
+        :param build_data: its cache entry
+        """
+        number = int(build_data[NUMBER])
+        position = bisect.bisect_left(self.builds, number)
+        if position < len(self.builds) and self.builds[position] == number:
+            return
+        self.builds.insert(position, number)
+        for test_name in build_data['failures']:
+            bisect.insort(self.failures.setdefault(test_name, []), number)
+
+    def refresh(self, store: sqlite3.Connection) -> None:
+        """
+        Catches up with the builds other jobs sharing the cache have added since we built the index, so a long-lived
+        index doesn't fall behind. Most are newer than any we have, so we only read those; if others filled in or
+        pruned older builds too, the count or sum of the build numbers won't agree, and we read the whole cache again.
+        :param store: the cache
+        """
+        last = self.builds[-1] if self.builds else -1
+        newer = [number for number, in store.execute('SELECT number FROM builds WHERE number > ? ORDER BY number', (last,))]
+        if newer:
+            log('Catching up with ' + str(len(newer)) + ' builds cached by other jobs')
+            self.builds.extend(newer)
+            # Only the failures of the builds we just read, in case more were added since
+            for test_name, number in store.execute('SELECT test_name, number FROM failures WHERE number > ? AND number <= ? '
+                                                   'ORDER BY test_name, number', (last, newer[-1])):
+                self.failures.setdefault(test_name, []).append(number)
+        count, total = store.execute('SELECT COUNT(*), COALESCE(SUM(number), 0) FROM builds WHERE number <= ?',
+                                     (self.builds[-1] if self.builds else -1,)).fetchone()
+        if count != len(self.builds) or total != sum(self.builds):
+            log('Cache changed under us; rebuilding the failure index')
+            self.__init__(store)
+
+    def remove(self, numbers: Set[int]) -> None:
+        """
+        Removes builds pruned from the cache.
+        """
+        if not numbers:
+            return
+        self.builds = [number for number in self.builds if number not in numbers]
+        for test_name in list(self.failures):
+            failed_in = [number for number in self.failures[test_name] if number not in numbers]
+            if failed_in:
+                self.failures[test_name] = failed_in
+            else:
+                del self.failures[test_name]
+
+    def total(self) -> int:
+        return len(self.builds)
+
+    def fail_count(self, test_name: str) -> int:
+        return len(self.failures.get(test_name, ()))
+
+    def fail_count_in_last(self, test_name: str, build_count: int) -> int:
+        """
+        :return: how many of the last build_count builds test_name failed in
+        """
+        failed_in = self.failures.get(test_name)
+        if not failed_in or build_count <= 0:
+            return 0
+        first_build = self.builds[max(len(self.builds) - build_count, 0)]
+        return len(failed_in) - bisect.bisect_left(failed_in, first_build)
+
+    def first_failed(self, test_name: str) -> Optional[int]:
+        """
+        :return: the number of the first build we have test_name failing in, or None if it hasn't failed
+        """
+        failed_in = self.failures.get(test_name)
+        return failed_in[0] if failed_in else None
+
+    def last_failed(self, test_name: str) -> Optional[int]:
+        """
+        :return: the number of the last build we have test_name failing in, or None if it hasn't failed
+        """
+        failed_in = self.failures.get(test_name)
+        return failed_in[-1] if failed_in else None
+
+
+def jira_class_name(test_name: str) -> str:
+    """
+    :return: what we search JIRA for tickets about test_name with
+    """
     # See if we have a ticket for this failure already; pull out last 2 tokens from the . delimited test FQN
     tokens = test_name.split('.')
 
@@ -318,44 +889,200 @@ def get_test_failure_details(jira: JIRA, test_name: str, data: Dict) -> tuple[in
     if '[' in class_name:
         btokens = class_name.split('[')
         class_name = btokens[1]
+    return class_name
+
+
+def find_cached_jira_tickets(jira: JiraClient, class_names: Set[str], ttl: int = DEFAULT_JIRA_TTL,
+                             negative_ttl: int = DEFAULT_JIRA_NEGATIVE_TTL,
+                             refresh: bool = False) -> Dict[str, Optional[List[str]]]:
+    """
+    Like find_jira_tickets, but reuses what earlier runs found, from cache/jira.db, for up to ttl seconds, or
+    negative_ttl if they found nothing. If refresh, searches JIRA for all of them regardless.
+    """
+    store = open_jira_cache()
+    now = int(time.time())
+    tickets: Dict[str, Optional[List[str]]] = {}
+    if not refresh:
+        for class_name, found, fetched in store.execute('SELECT class_name, tickets, fetched FROM jira_tickets'):
+            found = json.loads(found)
+            if class_name in class_names and now - fetched < (ttl if found else negative_ttl):
+                tickets[class_name] = found
+    log('Found JIRA tickets for ' + str(len(tickets)) + ' of ' + str(len(class_names)) + ' test classes in cache')
+
+    missing = class_names.difference(tickets)
+    if missing:
+        found_tickets = find_jira_tickets(jira, missing)
+        with store:
+            store.executemany('INSERT OR REPLACE INTO jira_tickets VALUES (?, ?, ?)',
+                              ((class_name, json.dumps(found), now) for class_name, found in found_tickets.items()
+                               if found is not None))
+            # Nothing older would be reused, so it's not worth keeping
+            store.execute('DELETE FROM jira_tickets WHERE fetched <= ?', (now - max(ttl, negative_ttl),))
+        tickets.update(found_tickets)
+    store.close()
+    return tickets
+
+
+def open_jira_cache() -> sqlite3.Connection:
+    """
+    Opens the cache of JIRA tickets found for test classes, creating it if need be. Unlike the build cache, it's shared
+    by all branches.
+    """
+    if not os.path.isdir('cache'):
+        os.mkdir('cache')
 
+    store = sqlite3.connect('cache/jira.db', timeout=CACHE_TIMEOUT, isolation_level=None)
+    store.execute('PRAGMA journal_mode = WAL')
+    store.execute('BEGIN IMMEDIATE')
+    try:
+        version, = store.execute('PRAGMA user_version').fetchone()
+        if version != JIRA_CACHE_VERSION:
+            store.execute('DROP TABLE IF EXISTS jira_tickets')
+            store.execute('CREATE TABLE jira_tickets (class_name TEXT PRIMARY KEY, tickets TEXT, fetched INTEGER)')
+            store.execute('PRAGMA user_version = %d' % JIRA_CACHE_VERSION)
+        store.execute('COMMIT')
+    except BaseException:
+        store.execute('ROLLBACK')
+        raise
+    store.isolation_level = ''
+    return store
+
+
+def find_jira_tickets(jira: JiraClient, class_names: Set[str]) -> Dict[str, Optional[List[str]]]:
+    """
+    Rather than a search per class name, ORs as many as fit together into each search, and searches again only to work
+    out which of the tickets found are for which class name. The searches run concurrently, up to jira.jobs at a time;
+    should one fail, we carry on without the tickets for its class names.
+    :return: the keys of the unresolved tickets a search for each class name finds, in the order JIRA found them, or
+             None for those we failed to look up
+    """
+    tickets: Dict[str, Optional[List[str]]] = {}
+    with ThreadPoolExecutor(max_workers=jira.jobs) as executor:
+        futures = {executor.submit(find_chunk_tickets, jira, chunk): chunk
+                   for chunk in chunk_class_names(sorted(class_names))}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                tickets.update(future.result())
+            except (JIRAError, OSError) as e:
+                print('ERROR! Got an exception attempting to get Jira for test failures. Reporting their lookups as failed.')
+                print('Query that raised the exception: ' + jira_tickets_query(chunk))
+                print('Exception received: ' + str(e))
+                for class_name in chunk:
+                    tickets[class_name] = None
+    return tickets
+
+
+def find_chunk_tickets(jira: JiraClient, class_names: List[str]) -> Dict[str, List[str]]:
+    """
+    Searches for the tickets for all of class_names at once, then for which are for which class name. JIRA's ~ matches
+    the words it splits a summary into, stemmed, rather than substrings, so that can't be worked out from the summaries
+    alone. They're used to guess, though: each class name a summary contains is searched for on its own, and the rest
+    together, which mostly finds nothing; if it doesn't, they're split in half and searched for again, and so on. While
+    few of class_names have tickets, that's a few searches rather than one for every class name.
+    :return: the keys of the tickets a search for each class name finds, in the order JIRA found them
+    """
+    found = search_jira_tickets(jira, class_names)
+    if not found or len(class_names) == 1:
+        return {class_name: [str(issue) for issue in found] for class_name in class_names}
+
+    summaries = [issue.fields.summary.lower() for issue in found]
+    guessed = [class_name for class_name in class_names if any(class_name.lower() in summary for summary in summaries)]
+    rest = [class_name for class_name in class_names if class_name not in guessed]
+    if guessed:
+        parts = [[class_name] for class_name in guessed] + ([rest] if rest else [])
+    else:
+        parts = [class_names[:len(class_names) // 2], class_names[len(class_names) // 2:]]
+    tickets: Dict[str, List[str]] = {}
+    for part in parts:
+        tickets.update(find_chunk_tickets(jira, part))
+    return tickets
+
+
+def search_jira_tickets(jira: JiraClient, class_names: List[str]) -> List:
+    query = jira_tickets_query(class_names)
+    log('Running query: ' + str(query))
+    found: List = []
+    while True:
+        # A page at a time, rather than all with maxResults=False, so each page's request waits its turn for a token
+        page = jira.search_issues(query, fields='summary', startAt=len(found), maxResults=JIRA_SEARCH_PAGE_SIZE)
+        found.extend(page)
+        if not page or len(found) >= page.total:
+            log('Result: ' + str(found))
+            return found
+
+
+def jira_tickets_query(class_names: List[str]) -> str:
     # If we have a runtime configured test name with braces in it, we search for the root test class name only since JQL
     # is not fond of braces
-    query = 'project = CASSANDRA and resolution = unresolved and summary ~ "*' + class_name + '*"'
-    log('About to query via the following JQL: ' + query)
-    try:
-        log('Running query: ' + str(query))
-        has_jira = jira.search_issues(query)
-        log('Result: ' + str(has_jira))
-    except Exception as e:
-        print('ERROR! Got an exception attempting to get Jira for test failure.')
-        print('Query that raised the exception: ' + query)
-        print('Exception received: ' + str(e))
-        print('Aborting.')
-        sys.exit(-1)
+    return JIRA_QUERY + '(' + ' or '.join(summary_term(class_name) for class_name in class_names) + ')'
+
+
+def chunk_class_names(class_names: List[str]) -> Iterator[List[str]]:
+    """
+    Splits class_names into lists short enough to search for together, within the limits on terms and query length.
+    """
+    chunk: List[str] = []
+    length = len(JIRA_QUERY) + 2
+    for class_name in class_names:
+        term_length = len(summary_term(class_name)) + len(' or ')
+        if chunk and (len(chunk) == JIRA_TERMS_PER_SEARCH or length + term_length > JIRA_MAX_QUERY_LENGTH):
+            yield chunk
+            chunk = []
+            length = len(JIRA_QUERY) + 2
+        chunk.append(class_name)
+        length += term_length
+    if chunk:
+        yield chunk
+
+
+def summary_term(class_name: str) -> str:
+    return JIRA_SUMMARY_TERM.format(class_name.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def get_test_failure_details(test_name: str, index: FailureIndex,
+                             jira_tickets: Dict[str, Optional[List[str]]]) -> tuple[int, int, str]:
+    """
+    :param index: FailureIndex of the cache
+    :param jira_tickets: the tickets found for each class name, by find_jira_tickets
+    :return: failures, total, test failure JIRA url if found, link to test board if not
+    """
+    fail_count = index.fail_count(test_name)
+    total = index.total()
+
+    class_name = jira_class_name(test_name)
+    has_jira = jira_tickets[class_name]
 
     result = ''
     # We have a few states here:
     #   1) Empty result; didn't find anything w/this name. Point to the test board w/link
     #   2) We have *too many* results, or > 1. Link to the JQL that queries that so someone can check it out
     #   3) We have a single ticket who's summary matches our failure name.
-    if has_jira == []:
+    #   4) We couldn't search JIRA for it. Link to the JQL so someone can do it by hand
+    if has_jira is None:
+        result = '[JIRA lookup failed|' + jql_url(JIRA_QUERY + summary_term(class_name)) + ']'
+    elif has_jira == []:
         result = '[No JIRA found|https://issues.apache.org/jira/secure/RapidBoard.jspa?rapidView=496&quickFilter=2252]'
     elif len(has_jira) > 2:
-        # Clean up some of our most common culprits that show up in Jira queries
-        query = query.replace(' ', '%20')
-        query = query.replace('=', '%3D')
-        query = query.replace('\\', '%5C')
-        result = '[Multiple JIRAs found|https://issues.apache.org/jira/issues/?jql=' + query + ']'
+        result = '[Multiple JIRAs found|' + jql_url(JIRA_QUERY + summary_term(class_name)) + ']'
     else:
-        result = '[' + str(has_jira[0]) + '?|https://issues.apache.org/jira/browse/' + str(has_jira[0]) + ']|'
+        result = '[' + has_jira[0] + '?|https://issues.apache.org/jira/browse/' + has_jira[0] + ']|'
 
     return fail_count, total, result
 
 
+def jql_url(query: str) -> str:
+    # Clean up some of our most common culprits that show up in Jira queries
+    query = query.replace(' ', '%20')
+    query = query.replace('=', '%3D')
+    query = query.replace('\\', '%5C')
+    return 'https://issues.apache.org/jira/issues/?jql=' + query
+
+
 def log(to_log: str) -> None:
     if VERBOSE:
         print(to_log)
 
 
-main()
+if __name__ == '__main__':
+    main()